@@ -1,28 +1,60 @@
+import time
 from pathlib import Path
 import pandas as pd
 import matplotlib.pyplot as plt
-from shiny import App, render, reactive, ui
-from ipyleaflet import Map, basemaps, Marker, Icon, Heatmap
+from shiny import App, render, reactive, req, ui
+from ipyleaflet import Map, basemaps, Marker, Icon, Heatmap, LayerGroup, Polyline
 from shinywidgets import render_widget, output_widget
-from www.helpers.utilities import generate_styles
+from starlette.routing import Mount
+from www.helpers.utilities import describe_data_age, generate_styles, get_delay_color
 from www.helpers.constants import (
+    ANOMALY_NOTIFICATION_SECONDS,
     CONTAINER_HEIGHT,
-    STATIC_URL,
-    DATA_REFRESH_INTERVAL_SECONDS,
+    DATA_AGE_UPDATE_SECONDS,
+    HISTOGRAM_BINS,
+    STOP_SEARCH_LIMIT,
 )
-from www.helpers.feed import fetch_and_process_data, download_and_extract_zip
+from www.helpers.anomalies import AnomalyDetector
+from www.helpers.export import create_export_app
+from www.helpers.feed import prepare_static_feed
+from www.helpers.search import (
+    SELECTIZE_ON_LOAD_JS,
+    SELECTIZE_SCORE_JS,
+    stop_search_endpoint,
+)
+from www.helpers.shapes import load_route_shapes
+from www.helpers.shared import create_snapshot_store
 import ipywidgets as widgets
-from www.helpers.utilities import get_stop_info
-
-download_and_extract_zip(STATIC_URL, "./www/static_data")
-
-
-# Reactive polling function
-@reactive.poll(
-    fetch_and_process_data, interval_secs=DATA_REFRESH_INTERVAL_SECONDS
-)  # Updated based on refresh interval
+from www.helpers.utilities import get_stop_arrivals, rows_for_stop
+
+# One snapshot store per process, shared by every session and the export API.
+# Workers elect a leader through the snapshot directory (the checkpoint
+# directory unless HALIFAX_SHARED_SNAPSHOT_DIR is set), and only it fetches the
+# feed; the others read its snapshots
+snapshot_store = create_snapshot_store()
+# Learns each route's usual delays as snapshots arrive, before sessions see them
+anomaly_detector = AnomalyDetector()
+snapshot_store.add_listener(anomaly_detector.update)
+# Sessions render the last checkpointed snapshot straight away, while the leader
+# downloads the static feed, simplifies its route shapes and fetches a fresh
+# snapshot in the background
+snapshot_store.start(prepare=prepare_static_feed if snapshot_store.is_leader else None)
+
+
+# Reactive polling function, cheap to check since it only compares versions.
+# Never waits for a snapshot, since it runs on the event loop every worker
+# request shares; None until the first one is published
+@reactive.poll(lambda: snapshot_store.version, interval_secs=1)
+def get_snapshot():
+    return snapshot_store.latest()
+
+
+@reactive.calc
 def get_processed_data():
-    return fetch_and_process_data()
+    # Outputs stay empty until there is data to show
+    snapshot = get_snapshot()
+    req(snapshot)
+    return snapshot.data
 
 
 def app_ui():
@@ -45,7 +77,19 @@ def app_ui():
             ui.row(
                 ui.column(
                     12,
-                    ui.output_ui("stop_selector"),
+                    ui.input_selectize(
+                        "selected_stop",
+                        "Select a Stop",
+                        choices=[],
+                        multiple=False,
+                        options={
+                            "placeholder": "Stop name, stop code or intersection",
+                            "maxOptions": STOP_SEARCH_LIMIT,
+                            "loadThrottle": 100,
+                            "score": ui.js_eval(SELECTIZE_SCORE_JS),
+                            "onLoad": ui.js_eval(SELECTIZE_ON_LOAD_JS),
+                        },
+                    ),
                 ),
             ),
             ui.row(
@@ -66,15 +110,28 @@ def app_ui():
                 output_widget("delays_heatmap"),
             ),
         ),
+        ui.nav_spacer(),
+        ui.nav_control(ui.output_text("data_age")),
         title="Halifax Transit Live Metrics",
     )
 
 
 def server(input, output, session):
+    @render.text
+    def data_age():
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return "Waiting for data"
+        # Keep the age current even when no new snapshot arrives
+        reactive.invalidate_later(DATA_AGE_UPDATE_SECONDS)
+        return describe_data_age(
+            snapshot.created_at, time.time(), snapshot_store.interval_secs
+        )
+
     @render.data_frame
     def delays():
         data = get_processed_data()
-        median_delays_df = pd.DataFrame(data["median_delays"])
+        median_delays_df = data["median_delays"].to_pandas()
         median_delays_df.rename(
             columns={
                 "arrival_difference_minutes": "Median Delay (Minutes)",
@@ -99,8 +156,8 @@ def server(input, output, session):
         data = get_processed_data()
         fig, ax = plt.subplots()
         ax.hist(
-            data["histogram_data"],
-            bins=100,
+            data["histogram_data"]["value"].to_numpy(),
+            bins=HISTOGRAM_BINS,
             edgecolor="black",
         )
         ax.set_title("Current Delays (Minutes)")
@@ -110,21 +167,37 @@ def server(input, output, session):
 
         return fig
 
-    @render.ui
-    def stop_selector():
-        data = fetch_and_process_data()
-        choices = data["stop_names"]
-        return ui.input_selectize(
-            "selected_stop", "Select a Stop", choices=choices, multiple=False
-        )
+    # Only alert about snapshots that arrive after the session starts
+    last_alerted_version = reactive.value(snapshot_store.version)
+
+    @reactive.effect
+    def notify_anomalies():
+        get_processed_data()
+        with reactive.isolate():
+            since = last_alerted_version()
+        anomalies = anomaly_detector.alerts_since(since, kind="route")
+        for anomaly in anomalies:
+            ui.notification_show(
+                anomaly.message,
+                type="warning",
+                duration=ANOMALY_NOTIFICATION_SECONDS,
+                id=f"anomaly-route-{anomaly.key}",
+            )
+        if anomalies:
+            last_alerted_version.set(max(anomaly.version for anomaly in anomalies))
+
+    @reactive.effect
+    def stop_search():
+        # Serve the stop choices from the search index, one query at a time,
+        # rather than sending every stop name to the browser
+        url = session.dynamic_route("stop_search", stop_search_endpoint)
+        session.send_input_message("selected_stop", {"url": url})
 
     @render.data_frame
     def stop_details():
         data = get_processed_data()
 
-        merged_df = pd.DataFrame(data["merged_df"])
-
-        stop_details = get_stop_info(merged_df, input.selected_stop())
+        stop_details = get_stop_arrivals(data["merged_df"], input.selected_stop())
 
         stop_details["arrival_time_minutes_from_now"] = (
             stop_details["arrival_time_minutes_from_now"].round().astype(int)
@@ -155,11 +228,28 @@ def server(input, output, session):
             styles=df_styles,
         )
 
+    # Set once the first snapshot arrives. Setting the same value again doesn't
+    # invalidate readers, so the map isn't rebuilt for every later snapshot
+    has_data = reactive.value(False)
+
+    @reactive.effect
+    def note_first_snapshot():
+        get_processed_data()
+        has_data.set(True)
+
     @render_widget
     def map():
-        data = fetch_and_process_data()
-
-        merged_df = pd.DataFrame(data["merged_df"])
+        # Built once per session and stop selection, so panning and zooming
+        # survive new snapshots and route geometry is only sent once
+        req(has_data())
+        with reactive.isolate():
+            data = get_processed_data()
+
+        merged_df = rows_for_stop(
+            data["merged_df"],
+            input.selected_stop(),
+            ["stop_name", "stop_lat", "stop_lon"],
+        )
         unique_stops_df = merged_df.drop_duplicates(
             subset=["stop_name", "stop_lat", "stop_lon"]
         )
@@ -188,6 +278,8 @@ def server(input, output, session):
             layout=widgets.Layout(width="67vw", height="70vh"),
         )
 
+        add_route_shapes(m, data)
+
         # Add a marker only for the selected stop
         if selected_stop and not selected_stop_data.empty:
             icon = Icon(icon_url="img/Canberra_Bus_icon.png", icon_size=[12, 12])
@@ -196,11 +288,16 @@ def server(input, output, session):
 
         return m
 
+    @reactive.effect
+    def update_route_colors():
+        # Only the colors change between snapshots
+        color_route_shapes(map.widget, get_processed_data())
+
     @render_widget
     def delays_heatmap():
         data = get_processed_data()
 
-        delays_heatmap_df = pd.DataFrame(data["delays_heatmap_data"])
+        delays_heatmap_df = data["delays_heatmap_data"].to_pandas()
 
         median_arrival_diff_df = (
             delays_heatmap_df.groupby("stop_id")["arrival_difference_minutes"]
@@ -247,5 +344,61 @@ def server(input, output, session):
         return m
 
 
+ROUTES_LAYER = "Routes"
+
+
+def add_route_shapes(m, data):
+    # Only reads the cache the leader builds, simplifying on the event loop
+    # would stall every session
+    route_shapes = load_route_shapes()
+    if route_shapes is None:
+        return  # Not built for the current static feed yet
+
+    # Each line is named after its route, so later snapshots can recolor it
+    polylines = [
+        Polyline(
+            name=route_id,
+            locations=locations,
+            fill=False,
+            weight=3,
+            opacity=0.8,
+        )
+        for route_id, locations in route_shapes.lines(m.zoom)
+    ]
+    m.add_layer(LayerGroup(name=ROUTES_LAYER, layers=polylines))
+    color_route_shapes(m, data)
+
+    # Only send the level of detail that fits the current zoom to the browser
+    def update_level_of_detail(change):
+        old_level = route_shapes.level_for_zoom(change["old"])
+        new_level = route_shapes.level_for_zoom(change["new"])
+        if old_level == new_level:
+            return
+        for polyline, (_, locations) in zip(polylines, route_shapes.lines(new_level)):
+            polyline.locations = locations
+
+    m.observe(update_level_of_detail, names="zoom")
+
+
+def color_route_shapes(m, data):
+    # Route lines colored by their current median delay. Unchanged colors are
+    # not sent to the browser again
+    median_delays_df = data["median_delays"].to_pandas()
+    route_delays = dict(
+        zip(
+            median_delays_df["route_id"].astype(str),
+            median_delays_df["arrival_difference_minutes"],
+        )
+    )
+
+    for layer in m.layers:
+        if layer.name == ROUTES_LAYER:
+            for polyline in layer.layers:
+                polyline.color = get_delay_color(route_delays.get(polyline.name))
+
+
 www_dir = Path(__file__).parent / "www"
 app = App(app_ui(), server, static_assets=www_dir)
+
+# Read-only snapshot export, e.g. /api/route_medians.json
+app.starlette_app.routes.insert(0, Mount("/api", app=create_export_app(snapshot_store)))
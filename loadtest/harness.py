@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import psutil
+
+from loadtest.session import SessionMetrics, SimulatedSession
+from loadtest.stub_feed import StubFeedServer, build_static_feed
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(
+    feed: StubFeedServer, port: int, refresh_interval: int, work_dir: str, log
+) -> subprocess.Popen:
+    # The app downloads the static feed into ./www/static_data, so it runs
+    # from a scratch directory to keep the real data untouched
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if not key.startswith("HALIFAX_")
+    }
+    env.update(
+        HALIFAX_STATIC_URL=feed.static_url,
+        HALIFAX_FEED_URL=feed.feed_url,
+        HALIFAX_REFRESH_INTERVAL_SECONDS=str(refresh_interval),
+    )
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--app-dir",
+            str(REPO_ROOT),
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=work_dir,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def snapshot_version(base_url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(f"{base_url}/api/", timeout=5) as response:
+            return json.load(response)["version"]
+    except (OSError, ValueError):
+        return None
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        if snapshot_version(base_url):
+            return
+        time.sleep(0.25)
+    raise TimeoutError(f"App did not publish a snapshot within {timeout}s")
+
+
+class Monitor:
+    """Samples the app's CPU and memory, and the snapshot versions it publishes."""
+
+    def __init__(self, base_url: str, pid: int, interval: float = 0.5):
+        self.base_url = base_url
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu_percent: list[float] = []
+        self.rss_bytes: list[int] = []
+        # Snapshot versions are publish times in epoch milliseconds
+        self.versions: list[int] = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.process.cpu_percent()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.cpu_percent.append(self.process.cpu_percent())
+            self.rss_bytes.append(self.process.memory_info().rss)
+            version = snapshot_version(self.base_url)
+            if version and (not self.versions or version > self.versions[-1]):
+                self.versions.append(version)
+
+
+def percentiles(values) -> dict:
+    if len(values) == 0:
+        return {"count": 0}
+    values = np.asarray(values, dtype=float)
+    return {
+        "count": int(len(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def refresh_lags(arrivals: list[tuple[float, str]], versions: list[int]) -> list:
+    # Seconds between a snapshot being published and a session receiving the
+    # outputs it re-rendered, matching each arrival to the newest prior version
+    published = [version / 1000 for version in versions]
+    lags = []
+    for arrived_at, _ in arrivals:
+        i = bisect.bisect_right(published, arrived_at)
+        if i > 0:
+            lags.append(arrived_at - published[i - 1])
+    return lags
+
+
+def summarize(
+    metrics: list[SessionMetrics],
+    versions: list[int],
+    cpu_percent: list[float],
+    rss_bytes: list[int],
+    baseline_rss: int,
+    duration: float,
+) -> dict:
+    outputs = sorted({output for m in metrics for output in m.render_latencies})
+    render = {
+        output: percentiles(
+            [latency for m in metrics for latency in m.render_latencies.get(output, [])]
+        )
+        for output in outputs
+    }
+    # Snapshots published before the sessions connected can't be waited on
+    lags = [lag for m in metrics for lag in refresh_lags(m.refresh_arrivals, versions)]
+    sessions = len(metrics)
+    peak_rss = max(rss_bytes, default=baseline_rss)
+    return {
+        "sessions": sessions,
+        "duration_seconds": duration,
+        "snapshots_published": len(versions),
+        "actions": sum(m.actions for m in metrics),
+        "render_latency_seconds": render,
+        "refresh_lag_seconds": percentiles(lags),
+        "cpu_percent": {
+            "mean": float(np.mean(cpu_percent)) if cpu_percent else 0.0,
+            "max": float(max(cpu_percent, default=0.0)),
+        },
+        "memory": {
+            "baseline_rss_mb": baseline_rss / 2**20,
+            "peak_rss_mb": peak_rss / 2**20,
+            "per_session_mb": (peak_rss - baseline_rss) / 2**20 / max(sessions, 1),
+        },
+        "websocket": {
+            "bytes_received": sum(m.bytes_received for m in metrics),
+            "bytes_sent": sum(m.bytes_sent for m in metrics),
+            "messages_received": sum(m.messages_received for m in metrics),
+            "bytes_received_per_session_per_second": sum(
+                m.bytes_received for m in metrics
+            )
+            / max(sessions, 1)
+            / max(duration, 1e-9),
+        },
+        "errors": [error for m in metrics for error in m.errors][:20],
+        "error_count": sum(len(m.errors) for m in metrics),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['sessions']} sessions for {report['duration_seconds']:.0f}s, "
+        f"{report['actions']} actions, "
+        f"{report['snapshots_published']} snapshots published",
+        "",
+        f"{'output':<26}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}",
+    ]
+    rows = {
+        **report["render_latency_seconds"],
+        "refresh lag": report["refresh_lag_seconds"],
+    }
+    for name, stats in rows.items():
+        if not stats["count"]:
+            lines.append(f"{name:<26}{0:>7}")
+            continue
+        lines.append(
+            f"{name:<26}{stats['count']:>7}"
+            f"{stats['p50'] * 1000:>10.0f}{stats['p95'] * 1000:>10.0f}"
+            f"{stats['max'] * 1000:>10.0f}"
+        )
+
+    cpu, memory, websocket = (
+        report["cpu_percent"],
+        report["memory"],
+        report["websocket"],
+    )
+    lines += [
+        "",
+        f"CPU: {cpu['mean']:.0f}% mean, {cpu['max']:.0f}% max",
+        f"Memory: {memory['baseline_rss_mb']:.0f} MB idle, "
+        f"{memory['peak_rss_mb']:.0f} MB peak, "
+        f"{memory['per_session_mb']:.1f} MB per session",
+        f"Websocket: {websocket['bytes_received'] / 2**20:.1f} MB sent to clients "
+        f"({websocket['bytes_received_per_session_per_second'] / 1024:.1f} KB/s "
+        f"per session), {websocket['bytes_sent'] / 1024:.0f} KB from clients",
+        f"Errors: {report['error_count']}",
+    ]
+    lines += [f"  {error}" for error in report["errors"]]
+    return "\n".join(lines)
+
+
+async def run_sessions(
+    base_url: str,
+    sessions: int,
+    duration: float,
+    ramp_up: float,
+    think_time: float,
+    stop_queries: list[str],
+) -> list[SessionMetrics]:
+    async def run_one(i: int) -> SessionMetrics:
+        # Spread connections out, and end every session at the same time
+        delay = ramp_up * i / max(sessions, 1)
+        await asyncio.sleep(delay)
+        session = SimulatedSession(base_url, stop_queries, think_time, seed=i)
+        await session.run(duration - delay)
+        return session.metrics
+
+    return await asyncio.gather(*(run_one(i) for i in range(sessions)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest",
+        description="Load test one app worker with simulated dashboard sessions.",
+    )
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--think-time", type=float, default=5, help="mean seconds between actions"
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=int,
+        default=15,
+        help="seconds between feed refreshes in the app under test",
+    )
+    parser.add_argument("--routes", type=int, default=60)
+    parser.add_argument("--stops", type=int, default=2400)
+    parser.add_argument(
+        "--url", help="test an app that is already running instead of starting one"
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument(
+        "--max-render-p95",
+        type=float,
+        help="fail if any output's p95 render latency exceeds this many seconds",
+    )
+    parser.add_argument(
+        "--max-refresh-lag-p95",
+        type=float,
+        help="fail if the p95 refresh lag exceeds this many seconds",
+    )
+    args = parser.parse_args(argv)
+
+    tables = build_static_feed(routes=args.routes, stops=args.stops)
+    stop_queries = tables["stops"]["stop_name"].unique().tolist()
+    feed = process = app_log = None
+    work_dir = tempfile.TemporaryDirectory(prefix="halifax-loadtest-")
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+            pid = None
+        else:
+            feed = StubFeedServer(tables)
+            feed.start()
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            app_log = open(Path(work_dir.name) / "app.log", "w+")
+            process = start_app(
+                feed, port, args.refresh_interval, work_dir.name, app_log
+            )
+            try:
+                wait_until_ready(base_url, process, timeout=180)
+            except (RuntimeError, TimeoutError):
+                app_log.seek(0)
+                print(app_log.read()[-5000:], file=sys.stderr)
+                raise
+            pid = process.pid
+
+        # Resources can only be sampled for an app started here
+        monitor = Monitor(base_url, pid or os.getpid())
+        baseline_rss = monitor.process.memory_info().rss
+        monitor.start()
+        started = time.monotonic()
+        metrics = asyncio.run(
+            run_sessions(
+                base_url,
+                args.sessions,
+                args.duration,
+                args.ramp_up,
+                args.think_time,
+                stop_queries,
+            )
+        )
+        duration = time.monotonic() - started
+        monitor.stop()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if app_log is not None:
+            app_log.close()
+        if feed is not None:
+            feed.stop()
+        work_dir.cleanup()
+
+    report = summarize(
+        metrics,
+        monitor.versions,
+        monitor.cpu_percent if pid else [],
+        monitor.rss_bytes if pid else [],
+        baseline_rss if pid else 0,
+        duration,
+    )
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_render_p95 is not None:
+        failures += [
+            f"{output} p95 render latency {stats['p95']:.2f}s"
+            for output, stats in report["render_latency_seconds"].items()
+            if stats["count"] and stats["p95"] > args.max_render_p95
+        ]
+    lag = report["refresh_lag_seconds"]
+    if (
+        args.max_refresh_lag_p95 is not None
+        and lag["count"]
+        and lag["p95"] > args.max_refresh_lag_p95
+    ):
+        failures.append(f"p95 refresh lag {lag['p95']:.2f}s")
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        return 1
+    return 0
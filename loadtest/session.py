@@ -0,0 +1,213 @@
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Optional
+
+from websockets.asyncio.client import connect
+
+# Outputs shown on each tab of app.py; the browser reports the others as hidden
+OUTPUTS_BY_TAB = {
+    "Delays": ("delays", "histogram"),
+    "Route Details": ("stop_details", "map"),
+    "Heatmap": ("delays_heatmap",),
+}
+# Outputs in the navbar, visible on every tab
+NAVBAR_OUTPUTS = ("data_age",)
+PLOT_OUTPUTS = ("histogram",)
+SEARCH_OUTPUT = "selected_stop (search)"
+# Not a server method: Shiny answers it with an error, but only once it has
+# handled every earlier message and flushed their outputs
+MARKER_METHOD = "loadtest_marker"
+
+
+@dataclass
+class SessionMetrics:
+    # Seconds from a session's action to each output it re-rendered
+    render_latencies: dict[str, list[float]] = field(default_factory=dict)
+    # (arrival time, output) for outputs re-rendered by a data refresh
+    refresh_arrivals: list[tuple[float, str]] = field(default_factory=list)
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    messages_received: int = 0
+    actions: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def add_latency(self, output: str, seconds: float):
+        self.render_latencies.setdefault(output, []).append(seconds)
+
+
+class SimulatedSession:
+    """A browser session driven over Shiny's websocket protocol.
+
+    Sends the client data a browser would (which outputs are visible, plot
+    sizes), then switches tabs and picks stops through the stop search, timing
+    how long each visible output takes to come back.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        stop_queries: list[str],
+        think_time: float = 5.0,
+        seed: Optional[int] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.stop_queries = stop_queries
+        self.think_time = think_time
+        self.metrics = SessionMetrics()
+        self._rng = random.Random(seed)
+        self._tab = "Delays"
+        self._client_data_sent: dict = {}
+        self._search_url: Optional[str] = None
+        # The action whose outputs are still coming back, and when it was sent
+        self._pending_tag = 0
+        self._pending_since: Optional[float] = None
+
+    def _client_data(self, tab: str) -> dict:
+        data = {
+            f".clientdata_output_{output}_hidden": tab_name != tab
+            for tab_name, outputs in OUTPUTS_BY_TAB.items()
+            for output in outputs
+        }
+        for output in NAVBAR_OUTPUTS:
+            data[f".clientdata_output_{output}_hidden"] = False
+        for output in PLOT_OUTPUTS:
+            data[f".clientdata_output_{output}_width"] = 900
+            data[f".clientdata_output_{output}_height"] = 700
+
+        # Like the browser, only send what changed
+        changed = {
+            key: value
+            for key, value in data.items()
+            if self._client_data_sent.get(key, not value) != value
+        }
+        self._client_data_sent.update(changed)
+        return changed
+
+    def _init_message(self) -> dict:
+        data = {
+            **self._client_data(self._tab),
+            ".clientdata_pixelratio": 1,
+            "selected_stop": None,
+        }
+        return {"method": "init", "data": data}
+
+    async def run(self, duration: float):
+        url = "ws" + self.base_url.removeprefix("http") + "/websocket/"
+        deadline = time.monotonic() + duration
+        try:
+            async with connect(url, max_size=None, compression=None) as websocket:
+                receiver = asyncio.create_task(self._receive(websocket))
+                try:
+                    await self._send(websocket, self._init_message())
+                    while time.monotonic() < deadline:
+                        pause = self._rng.expovariate(1 / self.think_time)
+                        await asyncio.sleep(min(pause, deadline - time.monotonic()))
+                        if time.monotonic() >= deadline:
+                            break
+                        await self._act(websocket)
+                finally:
+                    receiver.cancel()
+        except Exception as e:
+            self.metrics.errors.append(f"{type(e).__name__}: {e}")
+
+    async def first_render(self, output: str, timeout: float = 30) -> tuple:
+        # Seconds from connecting until ``output`` first renders, with every
+        # output value received by then
+        url = "ws" + self.base_url.removeprefix("http") + "/websocket/"
+        start = time.perf_counter()
+        values = {}
+        async with connect(url, max_size=None, compression=None) as websocket:
+            await self._send(websocket, self._init_message())
+            async with asyncio.timeout(timeout):
+                async for text in websocket:
+                    values.update(json.loads(text).get("values", {}))
+                    # An output waiting for data is sent empty first
+                    if values.get(output) is not None:
+                        return time.perf_counter() - start, values
+
+    async def _act(self, websocket):
+        self.metrics.actions += 1
+        if self._tab == "Route Details" and self._rng.random() < 0.6:
+            await self._select_stop(websocket)
+            return
+
+        tab = self._rng.choice([tab for tab in OUTPUTS_BY_TAB if tab != self._tab])
+        self._tab = tab
+        await self._send(
+            websocket, {"method": "update", "data": self._client_data(tab)}
+        )
+
+    async def _select_stop(self, websocket):
+        if self._search_url is None or not self.stop_queries:
+            return
+
+        # Type a few characters of a stop name, then pick the top suggestion
+        name = self._rng.choice(self.stop_queries)
+        query = name[: self._rng.randint(3, min(12, len(name)))]
+        params = urllib.parse.urlencode(
+            {"query": query, "field": "value", "maxop": 50, "conju": "and"}
+        )
+        start = time.perf_counter()
+        try:
+            body = await asyncio.to_thread(
+                _http_get, f"{self.base_url}/{self._search_url}&{params}"
+            )
+        except OSError as e:
+            self.metrics.errors.append(f"search: {e}")
+            return
+        self.metrics.add_latency(SEARCH_OUTPUT, time.perf_counter() - start)
+
+        results = json.loads(body)
+        if results:
+            await self._send(
+                websocket,
+                {"method": "update", "data": {"selected_stop": results[0]["value"]}},
+            )
+
+    async def _send(self, websocket, message: dict):
+        self._pending_tag += 1
+        marker = {"method": MARKER_METHOD, "tag": self._pending_tag, "args": []}
+        self._pending_since = time.perf_counter()
+        for text in (json.dumps(message), json.dumps(marker)):
+            self.metrics.bytes_sent += len(text.encode())
+            await websocket.send(text)
+
+    async def _receive(self, websocket):
+        async for text in websocket:
+            now = time.perf_counter()
+            self.metrics.messages_received += 1
+            self.metrics.bytes_received += len(
+                text.encode() if isinstance(text, str) else text
+            )
+            message = json.loads(text)
+
+            for output, error in message.get("errors", {}).items():
+                self.metrics.errors.append(f"{output}: {error.get('message')}")
+
+            # Outputs flushed before the marker's answer were rendered for the
+            # pending action, any others for a data refresh
+            outputs = [*message.get("values", {}), *message.get("errors", {})]
+            for output in outputs:
+                if self._pending_since is not None:
+                    self.metrics.add_latency(output, now - self._pending_since)
+                else:
+                    self.metrics.refresh_arrivals.append((time.time(), output))
+
+            response = message.get("response", {})
+            if response.get("tag") == self._pending_tag:
+                self._pending_since = None
+
+            for input_message in message.get("inputMessages", []):
+                url = input_message.get("message", {}).get("url")
+                if input_message.get("id") == "selected_stop" and url:
+                    self._search_url = url
+
+
+def _http_get(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
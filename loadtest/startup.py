@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loadtest.harness import free_port, start_app, wait_until_ready
+from loadtest.session import SimulatedSession
+from loadtest.stub_feed import StubFeedServer, build_static_feed
+
+# The first output a session sees on the default tab
+FIRST_OUTPUT = "delays"
+
+
+def wait_until_listening(port: int, process, timeout: float) -> float:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return time.monotonic()
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"App did not accept connections within {timeout}s")
+
+
+def measure_warm_start(
+    feed: StubFeedServer, work_dir: str, log, realtime_delay: float
+) -> dict:
+    # A first run leaves the static feed and a checkpoint behind, as a
+    # previous deploy would
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_app(feed, port, 60, work_dir, log)
+    try:
+        wait_until_ready(base_url, process, timeout=180)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    # Restart with a stale checkpoint and a slow upstream feed, so a fresh fetch
+    # starts at once and can't finish before the first session renders
+    feed.realtime_delay = realtime_delay
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    process = start_app(feed, port, 1, work_dir, log)
+    try:
+        listening = wait_until_listening(port, process, timeout=60)
+        session = SimulatedSession(base_url, [])
+        first_render, values = asyncio.run(session.first_render(FIRST_OUTPUT))
+        rendered = time.monotonic()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {
+        "startup_seconds": listening - started,
+        "first_render_seconds": first_render,
+        # What a user waiting on a restart sees: imports, the checkpoint load
+        # and the first session together
+        "start_to_render_seconds": rendered - started,
+        "data_age": values.get("data_age"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest.startup",
+        description="Measure time to first render when a worker restarts.",
+    )
+    parser.add_argument(
+        "--realtime-delay",
+        type=float,
+        default=5,
+        help="seconds the stub takes to answer each trip update request",
+    )
+    parser.add_argument(
+        "--max-first-render",
+        type=float,
+        default=1.0,
+        help="fail if the first output takes longer than this many seconds "
+        "after connecting",
+    )
+    parser.add_argument(
+        "--max-start-to-render",
+        type=float,
+        default=5.0,
+        help="fail if the first output takes longer than this many seconds "
+        "after the process starts",
+    )
+    args = parser.parse_args(argv)
+
+    feed = StubFeedServer(build_static_feed(routes=60, stops=2400))
+    feed.start()
+    with tempfile.TemporaryDirectory(prefix="halifax-startup-") as work_dir:
+        with open(Path(work_dir) / "app.log", "w+") as log:
+            try:
+                result = measure_warm_start(feed, work_dir, log, args.realtime_delay)
+            except (RuntimeError, TimeoutError):
+                log.seek(0)
+                print(log.read()[-5000:], file=sys.stderr)
+                raise
+            finally:
+                feed.stop()
+
+    print(f"Accepting connections {result['startup_seconds']:.2f}s after start")
+    print(
+        f"First render {result['first_render_seconds'] * 1000:.0f} ms after "
+        f"connecting, showing: {result['data_age']}"
+    )
+    print(
+        f"First render {result['start_to_render_seconds']:.2f}s after the "
+        "process started"
+    )
+
+    failures = []
+    if result["first_render_seconds"] > args.max_first_render:
+        failures.append(f"first render took over {args.max_first_render}s")
+    if result["start_to_render_seconds"] > args.max_start_to_render:
+        failures.append(
+            f"first render came over {args.max_start_to_render}s after start"
+        )
+    for failure in failures:
+        print(f"\nFAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import io
+import threading
+import time
+import zipfile
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+from google.transit import gtfs_realtime_pb2
+
+STATIC_PATH = "/static/google_transit.zip"
+REALTIME_PATH = "/realtime/TripUpdate/TripUpdates.pb"
+
+STREETS = (
+    "Barrington St",
+    "Spring Garden Rd",
+    "Quinpool Rd",
+    "Robie St",
+    "Gottingen St",
+    "Portland St",
+    "Lacewood Dr",
+    "Bayers Rd",
+    "Windmill Rd",
+    "Main St",
+    "Dunbrack St",
+    "Chebucto Rd",
+    "Young St",
+    "Almon St",
+    "Oxford St",
+    "Wyse Rd",
+)
+CONNECTORS = ("before", "after", "opposite", "at")
+HALIFAX_CENTER = (44.65, -63.60)
+
+
+def build_static_feed(
+    routes: int = 30,
+    stops: int = 1200,
+    trips_per_direction: int = 50,
+    stops_per_trip: int = 30,
+    seed: int = 0,
+) -> dict[str, pd.DataFrame]:
+    """Synthetic static GTFS tables shaped like the Halifax Transit feed.
+
+    Trips run every 20 minutes from 5:00, so part of the network is always
+    in service during the day.
+    """
+    rng = np.random.default_rng(seed)
+
+    first, second = rng.integers(0, len(STREETS), (2, stops))
+    second = np.where(second == first, (second + 1) % len(STREETS), second)
+    names = [
+        f"{STREETS[a]} {CONNECTORS[i % len(CONNECTORS)]} {STREETS[b]}"
+        for i, (a, b) in enumerate(zip(first, second))
+    ]
+    stops_df = pd.DataFrame(
+        {
+            "stop_id": np.arange(1000, 1000 + stops).astype(str),
+            "stop_code": np.arange(6000, 6000 + stops),
+            "stop_name": names,
+            "stop_desc": None,
+            "stop_lat": HALIFAX_CENTER[0] + rng.uniform(-0.1, 0.1, stops),
+            "stop_lon": HALIFAX_CENTER[1] + rng.uniform(-0.15, 0.15, stops),
+            "zone_id": None,
+            "stop_url": None,
+            "location_type": None,
+            "parent_station": None,
+            "stop_timezone": None,
+            "wheelchair_boarding": 1,
+        }
+    )
+
+    patterns = np.array(
+        [rng.choice(stops, stops_per_trip, replace=False) for _ in range(routes * 2)]
+    )
+    pattern = np.repeat(np.arange(routes * 2), trips_per_direction)
+    trip_count = len(pattern)
+    trip_ids = np.arange(1, trip_count + 1).astype(str)
+
+    trips_df = pd.DataFrame(
+        {
+            "route_id": (pattern // 2 + 1).astype(str),
+            "service_id": "weekday",
+            "trip_id": trip_ids,
+            "trip_headsign": [f"{p // 2 + 1} Headsign {p % 2}" for p in pattern],
+            "trip_short_name": None,
+            "direction_id": pattern % 2,
+            "block_id": np.arange(1, trip_count + 1),
+            "shape_id": pattern + 1,
+            "wheelchair_accessible": 1,
+            "bikes_allowed": 1,
+        }
+    )
+
+    # Every trip of a pattern visits the same stops, two minutes apart
+    start = 5 * 3600 + np.tile(np.arange(trips_per_direction) * 1200, routes * 2)
+    start += pattern * 30
+    seconds = start[:, None] + np.arange(stops_per_trip) * 120
+    clock = _format_clock(seconds.ravel())
+    stop_times_df = pd.DataFrame(
+        {
+            "trip_id": np.repeat(trip_ids, stops_per_trip),
+            "arrival_time": clock,
+            "departure_time": clock,
+            "stop_id": stops_df["stop_id"].to_numpy()[patterns[pattern]].ravel(),
+            "stop_sequence": np.tile(np.arange(1, stops_per_trip + 1), trip_count),
+            "stop_headsign": None,
+            "pickup_type": 0,
+            "drop_off_type": None,
+            "shape_dist_traveled": None,
+            "timepoint": 1,
+        }
+    )
+
+    # Shapes follow each pattern's stops, with a few points between stops
+    lat = stops_df["stop_lat"].to_numpy()[patterns]
+    lon = stops_df["stop_lon"].to_numpy()[patterns]
+    steps = np.linspace(0, 1, 5, endpoint=False)
+    shape_lat = (lat[:, :-1, None] + np.diff(lat)[:, :, None] * steps).reshape(
+        routes * 2, -1
+    )
+    shape_lon = (lon[:, :-1, None] + np.diff(lon)[:, :, None] * steps).reshape(
+        routes * 2, -1
+    )
+    points = shape_lat.shape[1]
+    shapes_df = pd.DataFrame(
+        {
+            "shape_id": np.repeat(np.arange(1, routes * 2 + 1), points),
+            "shape_pt_lat": shape_lat.ravel(),
+            "shape_pt_lon": shape_lon.ravel(),
+            "shape_pt_sequence": np.tile(np.arange(1, points + 1), routes * 2),
+        }
+    )
+
+    return {
+        "stops": stops_df,
+        "trips": trips_df,
+        "stop_times": stop_times_df,
+        "shapes": shapes_df,
+    }
+
+
+def _format_clock(seconds: np.ndarray) -> list[str]:
+    # GTFS times may run past 24:00 for trips that finish after midnight
+    hours, remainder = np.divmod(seconds, 3600)
+    minutes, secs = np.divmod(remainder, 60)
+    return [f"{h}:{m:02d}:{s:02d}" for h, m, s in zip(hours, minutes, secs)]
+
+
+def static_feed_zip(tables: dict[str, pd.DataFrame]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, df in tables.items():
+            z.writestr(f"{name}.txt", df.to_csv(index=False))
+    return buffer.getvalue()
+
+
+class TripUpdateGenerator:
+    """Builds GTFS-realtime trip updates for trips in service at a given time.
+
+    Each trip keeps a delay of its own that drifts a little between feeds, so
+    successive snapshots look like a live network.
+    """
+
+    def __init__(
+        self,
+        stop_times: pd.DataFrame,
+        seed: int = 0,
+        lookback_seconds: int = 3600,
+        lookahead_seconds: int = 1800,
+    ):
+        clock = stop_times["arrival_time"].str.split(":", expand=True).astype(int)
+        self._trip_ids = stop_times["trip_id"].to_numpy()
+        self._stop_ids = stop_times["stop_id"].to_numpy()
+        self._stop_sequences = stop_times["stop_sequence"].to_numpy()
+        self._scheduled = (clock[0] * 3600 + clock[1] * 60 + clock[2]).to_numpy()
+        self._rng = np.random.default_rng(seed)
+        unique_trips, self._trip_index = np.unique(self._trip_ids, return_inverse=True)
+        self._delays = self._rng.normal(120, 180, len(unique_trips))
+        self.lookback_seconds = lookback_seconds
+        self.lookahead_seconds = lookahead_seconds
+
+    def feed(self, now: float | None = None) -> bytes:
+        now = time.time() if now is None else now
+        midnight = datetime.fromtimestamp(now).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        seconds_today = now - midnight.timestamp()
+
+        self._delays += self._rng.normal(0, 15, len(self._delays))
+
+        in_window = (self._scheduled >= seconds_today - self.lookback_seconds) & (
+            self._scheduled <= seconds_today + self.lookahead_seconds
+        )
+        rows = np.flatnonzero(in_window)
+        arrivals = (
+            midnight.timestamp()
+            + self._scheduled[rows]
+            + self._delays[self._trip_index[rows]]
+        ).astype(np.int64)
+
+        message = gtfs_realtime_pb2.FeedMessage()
+        message.header.gtfs_realtime_version = "2.0"
+        message.header.timestamp = int(now)
+
+        entity = None
+        for row, arrival in zip(rows, arrivals):
+            trip_id = self._trip_ids[row]
+            if entity is None or entity.trip_update.trip.trip_id != trip_id:
+                entity = message.entity.add()
+                entity.id = trip_id
+                entity.trip_update.trip.trip_id = trip_id
+            update = entity.trip_update.stop_time_update.add()
+            update.stop_id = self._stop_ids[row]
+            update.stop_sequence = int(self._stop_sequences[row])
+            update.arrival.time = int(arrival)
+            update.departure.time = int(arrival)
+
+        return message.SerializeToString()
+
+
+class StubFeedServer:
+    """Serves a synthetic static feed and live trip updates over HTTP.
+
+    ``realtime_delay`` holds back each trip update response, standing in for a
+    slow upstream feed.
+    """
+
+    def __init__(
+        self,
+        tables: dict[str, pd.DataFrame],
+        host: str = "127.0.0.1",
+        realtime_delay: float = 0.0,
+    ):
+        static_zip = static_feed_zip(tables)
+        generator = TripUpdateGenerator(tables["stop_times"])
+        lock = threading.Lock()
+        self.realtime_delay = realtime_delay
+        self.requests = {STATIC_PATH: 0, REALTIME_PATH: 0}
+        requests = self.requests
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == STATIC_PATH:
+                    body = static_zip
+                    content_type = "application/zip"
+                elif self.path == REALTIME_PATH:
+                    time.sleep(stub.realtime_delay)
+                    with lock:
+                        body = generator.feed()
+                    content_type = "application/x-protobuf"
+                else:
+                    self.send_error(404)
+                    return
+
+                with lock:
+                    requests[self.path] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def static_url(self) -> str:
+        return self.base_url + STATIC_PATH
+
+    @property
+    def feed_url(self) -> str:
+        return self.base_url + REALTIME_PATH
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
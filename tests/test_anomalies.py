@@ -0,0 +1,215 @@
+import random
+import statistics
+import time
+import unittest
+from datetime import datetime
+
+import pyarrow as pa
+
+from www.helpers.anomalies import (
+    AnomalyDetector,
+    DelayStats,
+    Ewma,
+    P2Quantile,
+    RollingWindow,
+)
+from www.helpers.snapshot import Snapshot
+
+NOON = datetime(2024, 6, 3, 12, 15).timestamp()
+
+
+def make_snapshot(version, route_delays, created_at=NOON):
+    return Snapshot(
+        version=version,
+        created_at=created_at,
+        data={
+            "median_delays": pa.table(
+                {
+                    "route_id": pa.array(list(route_delays), pa.string()),
+                    "arrival_difference_minutes": pa.array(
+                        list(route_delays.values()), pa.float64()
+                    ),
+                }
+            ),
+            "delays_heatmap_data": pa.table(
+                {
+                    "stop_id": ["s1", "s1", "s2"],
+                    "stop_lat": [44.6, 44.6, 44.7],
+                    "stop_lon": [-63.6, -63.6, -63.5],
+                    "arrival_difference_minutes": [1.0, 2.0, 0.0],
+                    "propagated": [False, False, False],
+                }
+            ),
+        },
+    )
+
+
+class TestStreamingStatistics(unittest.TestCase):
+    def test_rolling_window(self):
+        window = RollingWindow(3)
+        for value in (1, 2, 3, 4, 5):
+            window.update(value)
+
+        self.assertEqual(window.count, 3)
+        self.assertAlmostEqual(window.mean, 4)
+        self.assertAlmostEqual(window.std, statistics.stdev([3, 4, 5]))
+
+    def test_ewma(self):
+        ewma = Ewma(alpha=0.5)
+        for value in (2, 4):
+            ewma.update(value)
+        self.assertAlmostEqual(ewma.mean, 3)
+        self.assertAlmostEqual(ewma.variance, 1)
+
+        # A constant stream converges on its value with no spread
+        ewma = Ewma(alpha=0.1)
+        for _ in range(200):
+            ewma.update(7)
+        self.assertAlmostEqual(ewma.mean, 7)
+        self.assertAlmostEqual(ewma.std, 0)
+
+    def test_p2_quantile(self):
+        rng = random.Random(0)
+        values = [rng.gauss(3, 2) for _ in range(10_000)]
+        median, p90 = P2Quantile(0.5), P2Quantile(0.9)
+        for value in values:
+            median.update(value)
+            p90.update(value)
+
+        exact = statistics.quantiles(values, n=10)
+        self.assertAlmostEqual(median.value, exact[4], delta=0.05)
+        self.assertAlmostEqual(p90.value, exact[8], delta=0.1)
+
+    def test_p2_quantile_few_values(self):
+        quantile = P2Quantile(0.5)
+        for value in (5, 1, 3):
+            quantile.update(value)
+        self.assertEqual(quantile.value, 3)
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    def learn(self, detector, snapshots=40):
+        rng = random.Random(0)
+        for version in range(1, snapshots + 1):
+            detector.update(
+                make_snapshot(version, {"1": 2 + rng.uniform(-1, 1), "2": 0.0})
+            )
+
+    def test_flags_unusual_route_delay(self):
+        detector = AnomalyDetector(min_samples=30)
+        self.learn(detector)
+        self.assertEqual(detector.alerts_since(0), [])
+
+        anomalies = detector.update(make_snapshot(41, {"1": 15.0, "2": 0.5}))
+
+        self.assertEqual([anomaly.key for anomaly in anomalies], ["1"])
+        anomaly = anomalies[0]
+        self.assertEqual(
+            (anomaly.kind, anomaly.version, anomaly.hour), ("route", 41, 12)
+        )
+        self.assertAlmostEqual(anomaly.expected, 2, delta=0.5)
+        self.assertIn("Route 1", anomaly.message)
+        self.assertIn("12:00", anomaly.message)
+
+    def test_usual_spread_is_not_flagged(self):
+        # Delays usually range well beyond what one quiet hour has seen
+        detector = AnomalyDetector(min_samples=30)
+        stats = detector.routes["1"] = DelayStats()
+        for value in [0.0, 4.0, 8.0, 12.0, 16.0] * 20:
+            stats.median.update(value)
+            stats.p90.update(value)
+        self.learn(detector)
+
+        self.assertEqual(detector.update(make_snapshot(41, {"1": 10.0})), [])
+        self.assertEqual(
+            [
+                anomaly.key
+                for anomaly in detector.update(make_snapshot(42, {"1": 20.0}))
+            ],
+            ["1"],
+        )
+
+    def test_recent_swings_raise_the_bar(self):
+        detector = AnomalyDetector(min_samples=30)
+        self.learn(detector)
+        # Recent snapshots swung widely, without reaching the hourly baseline
+        recent = detector.routes["1"].recent
+        for value in [-8.0, 12.0] * 30:
+            recent.update(value)
+
+        self.assertEqual(detector.update(make_snapshot(41, {"1": 15.0})), [])
+
+    def test_late_hour_keeps_baseline_from_previous_days(self):
+        detector = AnomalyDetector()
+        noon = datetime(2024, 6, 3, 12).timestamp()
+        version = 0
+        for day in range(15):
+            for snapshot in range(60):
+                version += 1
+                # Two weeks of punctual noons, then one running 13 minutes late
+                delay = 15.0 if day == 14 else 2 + (snapshot % 3 - 1) * 0.5
+                created_at = noon + day * 86400 + snapshot * 50
+                anomalies = detector.update(
+                    make_snapshot(version, {"1": delay}, created_at)
+                )
+
+        baseline = detector.routes["1"].hourly[12]
+        self.assertLess(baseline.mean, 3.5)
+        # Still unusual at the end of the late hour
+        self.assertEqual([anomaly.key for anomaly in anomalies], ["1"])
+
+    def test_baseline_is_per_hour(self):
+        detector = AnomalyDetector(min_samples=30)
+        self.learn(detector)
+
+        # Nothing is known about this hour yet
+        evening = datetime(2024, 6, 3, 18, 5).timestamp()
+        self.assertEqual(detector.update(make_snapshot(41, {"1": 15.0}, evening)), [])
+
+    def test_alerts_since(self):
+        detector = AnomalyDetector(min_samples=30)
+        self.learn(detector)
+        detector.update(make_snapshot(41, {"1": 15.0}))
+        detector.update(make_snapshot(42, {"1": 20.0}))
+
+        self.assertEqual(
+            [anomaly.version for anomaly in detector.alerts_since(41, kind="route")],
+            [42],
+        )
+        self.assertEqual(detector.alerts_since(42), [])
+        self.assertEqual(detector.alerts_since(0, kind="stop"), [])
+
+    def test_tracks_stops(self):
+        detector = AnomalyDetector()
+        detector.update(make_snapshot(1, {"1": 2.0}))
+        self.assertEqual(sorted(detector.stops), ["s1", "s2"])
+        self.assertAlmostEqual(detector.stops["s1"].ewma.mean, 1.5)
+
+    def test_ignores_propagated_stop_delays(self):
+        snapshot = make_snapshot(1, {"1": 2.0})
+        heatmap = snapshot.data["delays_heatmap_data"]
+        snapshot.data["delays_heatmap_data"] = heatmap.set_column(
+            4, "propagated", pa.array([False, True, True])
+        )
+        detector = AnomalyDetector()
+        detector.update(snapshot)
+        self.assertEqual(sorted(detector.stops), ["s1"])
+        self.assertAlmostEqual(detector.stops["s1"].ewma.mean, 1.0)
+
+    def test_update_cost_does_not_grow_with_history(self):
+        detector = AnomalyDetector()
+        routes = {str(route): float(route % 7) for route in range(100)}
+
+        def time_updates(first_version):
+            start = time.perf_counter()
+            for version in range(first_version, first_version + 20):
+                detector.update(make_snapshot(version, routes))
+            return time.perf_counter() - start
+
+        early = time_updates(1)
+        time_updates(21)
+        for version in range(41, 500):
+            detector.update(make_snapshot(version, routes))
+        late = time_updates(500)
+
+        self.assertLess(late, early * 3)
@@ -0,0 +1,187 @@
+import asyncio
+import gzip
+import io
+import json
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+
+from www.helpers.export import (
+    ExportCache,
+    build_histogram,
+    build_stop_delays,
+    create_export_app,
+    etag_matches,
+    negotiate_encoding,
+)
+from www.helpers.snapshot import SnapshotStore
+
+SAMPLE_DATA = {
+    "merged_df": pa.table(
+        {
+            "stop_id": ["1", "1", "2", "3"],
+            "stop_name": ["Stop A", "Stop A", "Stop B", "Stop C"],
+            "stop_lat": [44.6, 44.6, 44.7, 44.8],
+            "stop_lon": [-63.5, -63.5, -63.6, -63.7],
+            "arrival_difference_minutes": [2.0, 4.0, -1.0, None],
+        }
+    ),
+    "median_delays": pa.table(
+        {"route_id": ["2", "1"], "arrival_difference_minutes": [3, -1]}
+    ),
+    "histogram_data": pa.table({"value": [2.0, 4.0, -1.0]}),
+}
+
+
+def call_app(app, path, headers=None):
+    # Minimal ASGI client, so the tests don't need an HTTP client library
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (name.lower().encode(), value.encode())
+            for name, value in (headers or {}).items()
+        ],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+
+    start = messages[0]
+    response_headers = {
+        name.decode(): value.decode() for name, value in start["headers"]
+    }
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], response_headers, body
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.store = SnapshotStore(fetch=lambda: SAMPLE_DATA, interval_secs=60)
+        self.app = create_export_app(self.store)
+
+    def test_build_stop_delays(self):
+        result = build_stop_delays(SAMPLE_DATA)
+
+        self.assertEqual(result["stop_id"].tolist(), ["1", "2"])
+        self.assertEqual(result["median_delay_minutes"].tolist(), [3.0, -1.0])
+        self.assertEqual(result["observations"].tolist(), [2, 1])
+
+    def test_build_stop_delays_skips_propagated(self):
+        propagated = pa.array([False, True, True, False])
+        data = {
+            "merged_df": SAMPLE_DATA["merged_df"].append_column(
+                "propagated", propagated
+            )
+        }
+        result = build_stop_delays(data)
+
+        self.assertEqual(result["stop_id"].tolist(), ["1"])
+        self.assertEqual(result["median_delay_minutes"].tolist(), [2.0])
+        self.assertEqual(result["observations"].tolist(), [1])
+
+    def test_build_histogram(self):
+        result = build_histogram(SAMPLE_DATA)
+        self.assertEqual(result["count"].sum(), 3)
+        self.assertEqual(result["bin_start"].iloc[0], -1.0)
+        self.assertEqual(result["bin_end"].iloc[-1], 4.0)
+
+        empty = pa.table({"value": pa.array([], pa.float64())})
+        result = build_histogram({"histogram_data": empty})
+        self.assertTrue(result.empty)
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding(""), "identity")
+        self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate_encoding("gzip;q=0.5, br"), "br")
+        self.assertEqual(negotiate_encoding("br;q=0, gzip;q=0"), "identity")
+        self.assertEqual(negotiate_encoding("*"), "br")
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('W/"1-a-json"', 'W/"1-a-json"'))
+        self.assertTrue(etag_matches('"0-a-json", "1-a-json"', 'W/"1-a-json"'))
+        self.assertTrue(etag_matches("*", 'W/"1-a-json"'))
+        self.assertFalse(etag_matches('W/"0-a-json"', 'W/"1-a-json"'))
+
+    def test_cache_builds_once_per_version(self):
+        cache = ExportCache()
+        self.store.add_listener(cache.build)
+        snapshot = self.store.refresh()
+
+        self.assertIsNotNone(cache.get(snapshot.version))
+        self.assertIs(cache.build(snapshot), cache.get(snapshot.version))
+
+        # A fresh cache only builds on demand
+        other_cache = ExportCache()
+        self.assertIsNone(other_cache.get(snapshot.version))
+        payloads = other_cache.build(snapshot)
+        self.assertIs(other_cache.build(snapshot), payloads)
+
+    def test_unavailable_before_first_snapshot(self):
+        status, headers, _ = call_app(self.app, "/route_medians.json")
+        self.assertEqual(status, 503)
+
+    def test_unknown_table_or_format(self):
+        self.store.refresh()
+        self.assertEqual(call_app(self.app, "/trips.json")[0], 404)
+        self.assertEqual(call_app(self.app, "/route_medians.xml")[0], 404)
+
+    def test_json_export_and_revalidation(self):
+        snapshot = self.store.refresh()
+
+        status, headers, body = call_app(self.app, "/route_medians.json")
+        self.assertEqual(status, 200)
+        self.assertNotIn("content-encoding", headers)
+        self.assertIn("max-age=", headers["cache-control"])
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+
+        payload = json.loads(body)
+        self.assertEqual(payload["version"], snapshot.version)
+        self.assertEqual(
+            payload["data"],
+            [
+                {"route_id": "1", "median_delay_minutes": -1},
+                {"route_id": "2", "median_delay_minutes": 3},
+            ],
+        )
+
+        status, _, body = call_app(
+            self.app, "/route_medians.json", {"If-None-Match": headers["etag"]}
+        )
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b"")
+
+        # A new snapshot invalidates the old validator
+        self.store.refresh()
+        status, _, _ = call_app(
+            self.app, "/route_medians.json", {"If-None-Match": headers["etag"]}
+        )
+        self.assertEqual(status, 200)
+
+    def test_compressed_csv_and_arrow(self):
+        self.store.refresh()
+
+        status, headers, body = call_app(
+            self.app, "/stop_delays.csv", {"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-encoding"], "gzip")
+        result = pd.read_csv(io.BytesIO(gzip.decompress(body)))
+        self.assertEqual(result["stop_name"].tolist(), ["Stop A", "Stop B"])
+
+        status, headers, body = call_app(self.app, "/histogram.arrow")
+        self.assertEqual(status, 200)
+        table = pa.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column_names, ["bin_start", "bin_end", "count"])
+        self.assertEqual(sum(table.column("count").to_pylist()), 3)
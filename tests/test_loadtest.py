@@ -0,0 +1,140 @@
+import io
+import unittest
+import urllib.request
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+from google.transit import gtfs_realtime_pb2
+
+from loadtest.harness import format_report, refresh_lags, summarize
+from loadtest.session import SessionMetrics, SimulatedSession
+from loadtest.stub_feed import (
+    StubFeedServer,
+    TripUpdateGenerator,
+    build_static_feed,
+)
+from www.helpers.feed import parse_feed
+from www.helpers.schemas import (
+    real_time_schema,
+    shapes_schema,
+    stop_times_schema,
+    stops_schema,
+    trips_schema,
+)
+from www.helpers.utilities import process_stop_times_date, stringify_trips_and_stops
+
+
+class TestStubFeed(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tables = build_static_feed(routes=4, stops=50, trips_per_direction=10)
+
+    def read_static_feed(self, zip_data):
+        with zipfile.ZipFile(io.BytesIO(zip_data)) as z:
+            return {
+                name.removesuffix(".txt"): pd.read_csv(z.open(name))
+                for name in z.namelist()
+            }
+
+    def test_static_feed_matches_schemas(self):
+        server = StubFeedServer(self.tables)
+        server.start()
+        try:
+            with urllib.request.urlopen(server.static_url) as response:
+                tables = self.read_static_feed(response.read())
+        finally:
+            server.stop()
+
+        for name in ("stops", "trips", "stop_times"):
+            stringify_trips_and_stops(tables[name])
+        for column in ("arrival_time", "departure_time"):
+            tables["stop_times"][column] = tables["stop_times"][column].apply(
+                process_stop_times_date
+            )
+        tables["shapes"]["shape_id"] = tables["shapes"]["shape_id"].astype(str)
+
+        stops_schema.validate(tables["stops"])
+        trips_schema.validate(tables["trips"])
+        stop_times_schema.validate(tables["stop_times"])
+        shapes_schema.validate(tables["shapes"])
+        self.assertEqual(len(tables["trips"]), 4 * 2 * 10)
+
+    def test_trip_updates_cover_trips_in_service(self):
+        generator = TripUpdateGenerator(
+            self.tables["stop_times"], lookback_seconds=600, lookahead_seconds=600
+        )
+        now = datetime(2024, 6, 3, 8, 0).timestamp()
+
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(generator.feed(now))
+        realtime_data = parse_feed(feed)
+        stringify_trips_and_stops(realtime_data)
+        real_time_schema.validate(realtime_data)
+
+        self.assertGreater(len(realtime_data), 0)
+        arrivals = pd.to_datetime(realtime_data["arrival_time"])
+        # Within the window, give or take the trips' delays
+        self.assertGreaterEqual(arrivals.min(), datetime(2024, 6, 3, 7, 30))
+        self.assertLessEqual(arrivals.max(), datetime(2024, 6, 3, 8, 30))
+
+        # Nothing runs in the middle of the night
+        feed.ParseFromString(generator.feed(datetime(2024, 6, 3, 3, 0).timestamp()))
+        self.assertEqual(len(feed.entity), 0)
+
+
+class TestSimulatedSession(unittest.TestCase):
+    def test_client_data_only_sends_changes(self):
+        session = SimulatedSession("http://localhost:8000", [])
+
+        first = session._client_data("Delays")
+        self.assertFalse(first[".clientdata_output_delays_hidden"])
+        self.assertTrue(first[".clientdata_output_map_hidden"])
+        self.assertEqual(first[".clientdata_output_histogram_width"], 900)
+
+        self.assertEqual(
+            session._client_data("Heatmap"),
+            {
+                ".clientdata_output_delays_hidden": True,
+                ".clientdata_output_histogram_hidden": True,
+                ".clientdata_output_delays_heatmap_hidden": False,
+            },
+        )
+        self.assertEqual(session._client_data("Heatmap"), {})
+
+
+class TestReport(unittest.TestCase):
+    def test_refresh_lags(self):
+        versions = [10_000, 20_000]
+        arrivals = [(5.0, "delays"), (10.5, "delays"), (21.25, "map")]
+        self.assertEqual(refresh_lags(arrivals, versions), [0.5, 1.25])
+
+    def test_summarize(self):
+        first, second = SessionMetrics(), SessionMetrics()
+        first.render_latencies = {"delays": [0.1, 0.3]}
+        second.render_latencies = {"delays": [0.2], "map": [1.0]}
+        first.bytes_received, second.bytes_received = 1000, 3000
+        second.errors = ["map: boom"]
+
+        report = summarize(
+            [first, second],
+            versions=[1_000],
+            cpu_percent=[50, 100],
+            rss_bytes=[100 * 2**20, 120 * 2**20],
+            baseline_rss=100 * 2**20,
+            duration=10,
+        )
+
+        self.assertEqual(report["render_latency_seconds"]["delays"]["count"], 3)
+        self.assertAlmostEqual(report["render_latency_seconds"]["delays"]["p50"], 0.2)
+        self.assertEqual(report["refresh_lag_seconds"], {"count": 0})
+        self.assertEqual(report["cpu_percent"], {"mean": 75.0, "max": 100.0})
+        self.assertAlmostEqual(report["memory"]["per_session_mb"], 10)
+        self.assertEqual(
+            report["websocket"]["bytes_received_per_session_per_second"], 200
+        )
+        self.assertEqual(report["error_count"], 1)
+
+        text = format_report(report)
+        self.assertIn("delays", text)
+        self.assertIn("10.0 MB per session", text)
@@ -0,0 +1,118 @@
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from www.helpers.propagation import DelayPropagator, propagate_delays
+
+
+def make_large_stop_times(trips=10_800, stops_per_trip=40):
+    # A full day of service, e.g. 60 routes running 90 trips each way, listed
+    # in no particular order
+    rng = np.random.default_rng(0)
+    stop_sequence = np.tile(np.arange(1, stops_per_trip + 1), trips)
+    first_arrival = rng.integers(5 * 3600, 24 * 3600, trips)
+    return pd.DataFrame(
+        {
+            "trip_id": np.repeat(np.arange(trips), stops_per_trip).astype(str),
+            "stop_sequence": stop_sequence,
+            "arrival_time": np.repeat(first_arrival, stops_per_trip)
+            + (stop_sequence - 1) * 90,
+        }
+    ).sample(frac=1, random_state=0)
+
+
+def make_stop_times():
+    # Trip "b" is listed first and out of order, as feeds don't promise sorting
+    return pd.DataFrame(
+        {
+            "trip_id": ["b", "a", "a", "a", "b", "a"],
+            "stop_id": ["s3", "s1", "s3", "s2", "s4", "s4"],
+            "stop_sequence": [2, 1, 3, 2, 1, 4],
+            "arrival_time": [700, 100, 300, 200, 600, 400],
+            "departure_time": [700, 100, 300, 200, 600, 400],
+        }
+    )
+
+
+class TestDelayPropagator(unittest.TestCase):
+    def setUp(self):
+        self.stop_times = make_stop_times()
+        self.propagator = DelayPropagator(self.stop_times)
+
+    def downstream(self, trip_ids, stop_sequences, delays, half_life_minutes=None):
+        rows, propagated = self.propagator.propagate(
+            trip_ids, stop_sequences, delays, half_life_minutes
+        )
+        stops = self.stop_times.loc[rows, ["trip_id", "stop_id"]]
+        return list(zip(stops["trip_id"], stops["stop_id"], propagated))
+
+    def test_carries_last_delay_forward(self):
+        self.assertEqual(
+            self.downstream(["a", "a", "b"], [2, 1, 1], [90.0, 30.0, -60.0]),
+            [("a", "s3", 90.0), ("a", "s4", 90.0), ("b", "s3", -60.0)],
+        )
+
+    def test_skips_unknown_and_finished_trips(self):
+        self.assertEqual(
+            self.downstream(["a", "b", "x", "a"], [4, 1, 1, 3], [60, np.nan, 60, 0]),
+            [],
+        )
+        self.assertEqual(self.downstream([], [], []), [])
+
+    def test_decay(self):
+        # A half-life of 100 seconds of scheduled travel after the last update
+        downstream = self.downstream(["a"], [2], [120.0], half_life_minutes=100 / 60)
+        self.assertEqual([stop for _, stop, _ in downstream], ["s3", "s4"])
+        np.testing.assert_allclose([delay for *_, delay in downstream], [60.0, 30.0])
+
+    def test_propagate_delays(self):
+        midnight = pd.Timestamp("2024-06-03")
+        stop_times = self.stop_times.copy()
+        for column in ("arrival_time", "departure_time"):
+            stop_times[column] = midnight + pd.to_timedelta(stop_times[column], "s")
+        observed = stop_times.iloc[[3]].rename(
+            columns={
+                "arrival_time": "arrival_time_expected",
+                "departure_time": "departure_time_expected",
+            }
+        )
+        observed["arrival_time"] = observed["arrival_time_expected"] + pd.Timedelta(
+            minutes=2
+        )
+        observed["departure_time"] = observed["arrival_time"]
+
+        predicted = propagate_delays(observed, stop_times, self.propagator)
+
+        self.assertEqual(list(predicted.columns), list(observed.columns))
+        self.assertEqual(predicted["stop_id"].tolist(), ["s3", "s4"])
+        self.assertEqual(
+            (predicted["arrival_time"] - predicted["arrival_time_expected"]).tolist(),
+            [pd.Timedelta(minutes=2)] * 2,
+        )
+        self.assertEqual(
+            predicted["arrival_time"].tolist(),
+            [midnight + pd.Timedelta(seconds=s + 120) for s in (300, 400)],
+        )
+
+    def test_full_feed_is_fast(self):
+        stop_times = make_large_stop_times()
+        propagator = DelayPropagator(stop_times)
+
+        # About a fifth of the trips are running, each with a few updates
+        rng = np.random.default_rng(0)
+        updated = stop_times[stop_times["trip_id"].astype(int) % 5 == 0]
+        updated = updated[updated["stop_sequence"] <= rng.integers(1, 40)]
+        args = (
+            updated["trip_id"].to_numpy(),
+            updated["stop_sequence"].to_numpy(),
+            rng.normal(120, 60, len(updated)),
+        )
+
+        start = time.perf_counter()
+        rows, _ = propagator.propagate(*args, half_life_minutes=30)
+        elapsed = time.perf_counter() - start
+
+        self.assertGreater(len(rows), 10_000)
+        self.assertLess(elapsed, 0.05)
@@ -0,0 +1,110 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from www.helpers.schedule import StaticSchedule, load_static_schedule
+from www.helpers.utilities import process_stop_times_date
+
+
+def make_feed():
+    # Two trips over three stops, with every column the schemas expect
+    stops = pd.DataFrame(
+        {
+            "stop_id": ["1001", "1002", "1003"],
+            "stop_code": [6001, 6002, 6003],
+            "stop_name": ["Barrington St", "Spring Garden Rd", "Quinpool Rd"],
+            "stop_desc": None,
+            "stop_lat": [44.64, 44.64, 44.65],
+            "stop_lon": [-63.57, -63.58, -63.59],
+            "zone_id": None,
+            "stop_url": None,
+            "location_type": None,
+            "parent_station": None,
+            "stop_timezone": None,
+            "wheelchair_boarding": 1,
+        }
+    )
+    trips = pd.DataFrame(
+        {
+            "route_id": ["1", "1"],
+            "service_id": "weekday",
+            "trip_id": ["10", "11"],
+            "trip_headsign": ["1 Spring Garden", "1 Spring Garden"],
+            "trip_short_name": None,
+            "direction_id": 0,
+            "block_id": [1, 2],
+            "shape_id": 1,
+            "wheelchair_accessible": 1,
+            "bikes_allowed": 1,
+        }
+    )
+    clock = ["5:00:00", "5:02:00", "5:04:00", "23:58:00", "24:00:00", "24:02:00"]
+    stop_times = pd.DataFrame(
+        {
+            "trip_id": ["10"] * 3 + ["11"] * 3,
+            "arrival_time": clock,
+            "departure_time": clock,
+            "stop_id": ["1001", "1002", "1003"] * 2,
+            "stop_sequence": [1, 2, 3] * 2,
+            "stop_headsign": None,
+            "pickup_type": 0,
+            "drop_off_type": None,
+            "shape_dist_traveled": None,
+            "timepoint": 1,
+        }
+    )
+    return {"stop_times": stop_times, "trips": trips, "stops": stops}
+
+
+class TestStaticSchedule(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name)
+        self.tables = make_feed()
+        self.paths = []
+        for name in ("stop_times", "trips", "stops"):
+            path = self.directory / f"{name}.txt"
+            self.tables[name].to_csv(path, index=False)
+            self.paths.append(str(path))
+        self.cache_dir = str(self.directory / "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_stop_times_on_matches_clock_times(self):
+        schedule = StaticSchedule.from_csv(*self.paths)
+        stop_times = schedule.stop_times_on(datetime.now())
+
+        for column in ("arrival_time", "departure_time"):
+            expected = self.tables["stop_times"][column].apply(process_stop_times_date)
+            self.assertEqual(stop_times[column].tolist(), expected.tolist())
+        self.assertEqual(stop_times["trip_id"].dtype, object)
+
+    def test_save_and_load(self):
+        schedule = StaticSchedule.from_csv(*self.paths)
+        schedule.save(self.cache_dir, "abc")
+
+        loaded = StaticSchedule.load(self.cache_dir, "abc")
+        for name in ("stop_times", "trips", "stops"):
+            self.assertTrue(getattr(loaded, name).equals(getattr(schedule, name)))
+
+        # A different static feed, or no cache at all, means parsing again
+        self.assertIsNone(StaticSchedule.load(self.cache_dir, "def"))
+        self.assertIsNone(StaticSchedule.load(self.directory / "missing", "abc"))
+
+    def test_load_static_schedule_caches(self):
+        schedule = load_static_schedule(*self.paths, cache_dir=self.cache_dir)
+        self.assertIs(
+            load_static_schedule(*self.paths, cache_dir=self.cache_dir), schedule
+        )
+        self.assertTrue((Path(self.cache_dir) / "stop_times.arrow").exists())
+
+        # A new feed on disk replaces both the memoized and the cached schedule
+        self.tables["stops"].loc[0, "stop_name"] = "Renamed Stop"
+        self.tables["stops"].to_csv(self.paths[2], index=False)
+        updated = load_static_schedule(*self.paths, cache_dir=self.cache_dir)
+        self.assertIsNot(updated, schedule)
+        self.assertEqual(updated.stops.loc[0, "stop_name"], "Renamed Stop")
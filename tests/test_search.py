@@ -0,0 +1,253 @@
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pandas as pd
+import shiny
+
+from www.helpers.search import (
+    SELECTIZE_ON_LOAD_JS,
+    SELECTIZE_SCORE_JS,
+    StopSearchIndex,
+    load_stop_search_index,
+    normalize,
+    split_intersection,
+)
+
+SELECTIZE_JS = (
+    Path(shiny.__file__).parent
+    / "www"
+    / "shared"
+    / "selectize"
+    / "js"
+    / "selectize.min.js"
+)
+
+# Drives Shiny's own selectize without a browser: the DOM setup and rendering
+# are stubbed out, and loads are answered from canned stop search responses.
+# Prints the options selectize would show after each keystroke.
+SELECTIZE_HARNESS = r"""
+globalThis.navigator = { userAgent: "node" };
+globalThis.window = globalThis;
+globalThis.document = { createElement() { return { style: {} }; } };
+const Module = require("module");
+const baseRequire = Module.prototype.require;
+const $ = function () { return { on() {} }; };
+$.extend = function (...objects) {
+  const deep = typeof objects[0] === "boolean" ? objects.shift() : false;
+  const target = objects.shift() || {};
+  for (const object of objects) {
+    for (const key in object || {}) {
+      const value = object[key];
+      target[key] =
+        deep && value && typeof value === "object"
+          ? JSON.parse(JSON.stringify(value))
+          : value;
+    }
+  }
+  return target;
+};
+$.fn = {};
+Module.prototype.require = function (name) {
+  return name === "jquery" ? $ : baseRequire.apply(this, arguments);
+};
+const Selectize = require(process.argv[1]);
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+
+const settings = Object.assign({}, Selectize.defaults);
+for (const [key, source] of Object.entries(input.options)) {
+  settings[key] = eval("(" + source + ")");
+}
+Selectize.prototype.setup = function () {};
+Selectize.prototype.refreshOptions = function () {};
+const element = [{ tagName: "SELECT" }];
+element.parents = () => ({ attr() {} });
+element.attr = () => undefined;
+element.is = () => false;
+const selectize = new Selectize(element, settings);
+selectize.$wrapper = { addClass() { return this; }, removeClass() {} };
+selectize.settings.load = (query, callback) => callback(input.responses[query]);
+
+const shown = [];
+for (const query of input.queries) {
+  // The unthrottled handler, so each keystroke loads at once
+  Selectize.prototype.onSearchChange.call(selectize, query);
+  shown.push(selectize.search(query).items.map((item) => item.id));
+}
+console.log(JSON.stringify(shown));
+"""
+
+SAMPLE_STOPS = pd.DataFrame(
+    {
+        "stop_name": [
+            "Barrington St [Southbound] before Spring Garden Rd",
+            "Barrington St [Northbound] after Spring Garden Rd",
+            "Spring Garden Rd opposite Queen St",
+            "Quinpool Rd at Robie St",
+            "Quinpool Rd at Robie St",
+            "Mumford Terminal Bay 2",
+            "Lacewood Terminal Bay 1",
+        ],
+        "stop_code": ["6010", "6011", "7003", "8100", "8101", "6900", "7440"],
+    }
+)
+
+
+class TestStopSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = StopSearchIndex(SAMPLE_STOPS)
+
+    def values(self, query, limit=10):
+        return [result["value"] for result in self.index.search(query, limit)]
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("  Barrington  St. [Southbound]"), "barrington st southbound"
+        )
+        self.assertEqual(normalize("Côte-Saint-Luc"), "cote saint luc")
+
+    def test_split_intersection(self):
+        self.assertEqual(
+            split_intersection("Barrington St [Southbound] before Spring Garden Rd"),
+            ["barrington st", "spring garden rd"],
+        )
+        self.assertEqual(
+            split_intersection("Mumford Terminal Bay 2"), ["mumford terminal bay 2"]
+        )
+
+    def test_duplicate_names_are_one_choice(self):
+        results = self.index.search("quinpool")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["label"], "Quinpool Rd at Robie St (8100, 8101)")
+
+    def test_stop_code(self):
+        self.assertEqual(
+            self.values("6010")[0], "Barrington St [Southbound] before Spring Garden Rd"
+        )
+        self.assertEqual(len(self.values("601")), 2)
+
+    def test_name_prefix_ranks_first(self):
+        values = self.values("spring")
+        self.assertEqual(values[0], "Spring Garden Rd opposite Queen St")
+        # Token matches follow
+        self.assertEqual(len(values), 3)
+
+    def test_token_prefixes(self):
+        self.assertEqual(self.values("terminal bay 2"), ["Mumford Terminal Bay 2"])
+        self.assertEqual(self.values("robie quin"), ["Quinpool Rd at Robie St"])
+
+    def test_intersection(self):
+        values = self.values("spring garden & barrington")
+        self.assertEqual(len(values), 2)
+        self.assertTrue(all(value.startswith("Barrington St") for value in values))
+
+    def test_fuzzy(self):
+        self.assertEqual(self.values("lacewod")[0], "Lacewood Terminal Bay 1")
+        self.assertEqual(self.values("mumferd")[0], "Mumford Terminal Bay 2")
+        self.assertEqual(self.values("zzzz"), [])
+
+    def test_scores_keep_ranking(self):
+        results = self.index.search("barrington", limit=10)
+        scores = [result["score"] for result in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(score > 0 for score in scores))
+
+    def test_load_reloads_new_stops_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = str(Path(temp_dir) / "stops.txt")
+            SAMPLE_STOPS.to_csv(path, index=False)
+            index = load_stop_search_index(path)
+            self.assertIs(load_stop_search_index(path), index)
+
+            stops = pd.concat([SAMPLE_STOPS, pd.DataFrame({"stop_name": ["New Stop"]})])
+            stops.to_csv(path, index=False)
+            updated = load_stop_search_index(path)
+            self.assertIsNot(updated, index)
+            self.assertEqual(len(updated), len(index) + 1)
+
+    def test_empty_query_and_limit(self):
+        self.assertEqual(len(self.index.search("", limit=3)), 3)
+        self.assertEqual(len(self.index.search("", limit=100)), len(self.index))
+        self.assertEqual(len(self.index.search("rd", limit=2)), 2)
+
+    @unittest.skipUnless(shutil.which("node"), "needs Node.js")
+    def test_selectize_shows_matches_for_each_keystroke(self):
+        # Options loaded for an earlier keystroke must still show, in the
+        # server's order, when a longer query returns them again
+        queries = ["", "b", "ba", "bar", "barr", "barri", "bar", "quinpool"]
+        responses = {
+            query: [
+                {**result, "query": query}
+                for result in self.index.search(query, limit=3)
+            ]
+            for query in queries
+        }
+        result = subprocess.run(
+            ["node", "-e", SELECTIZE_HARNESS, str(SELECTIZE_JS)],
+            input=json.dumps(
+                {
+                    "options": {
+                        "score": SELECTIZE_SCORE_JS,
+                        "onLoad": SELECTIZE_ON_LOAD_JS,
+                    },
+                    "responses": responses,
+                    "queries": queries,
+                }
+            ),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        shown = json.loads(result.stdout)
+
+        for query, options in zip(queries[1:], shown[1:]):
+            expected = [result["value"] for result in responses[query]]
+            self.assertTrue(expected, query)
+            self.assertEqual(options, expected, query)
+
+    def test_search_speed(self):
+        rng = random.Random(0)
+        streets = [
+            f"{word} {kind}"
+            for word in (
+                "Barrington",
+                "Quinpool",
+                "Robie",
+                "Gottingen",
+                "Portland",
+                "Lacewood",
+                "Bayers",
+                "Windmill",
+                "Main",
+                "Dunbrack",
+                "Chebucto",
+                "Oxford",
+                "Young",
+                "Almon",
+                "Kempt",
+            )
+            for kind in ("St", "Rd", "Dr")
+        ]
+        names = [
+            f"{rng.choice(streets)} [{rng.choice(['Northbound', 'Southbound'])}] "
+            f"{rng.choice(['before', 'after', 'opposite', 'at'])} {rng.choice(streets)}"
+            for _ in range(3000)
+        ]
+        index = StopSearchIndex(
+            pd.DataFrame({"stop_name": names, "stop_code": range(6000, 9000)})
+        )
+
+        timings = []
+        for query in ("b", "st", "barr", "quinpol rd", "robie & almon", "75", "7512"):
+            for _ in range(5):
+                start = time.perf_counter()
+                index.search(query)
+                timings.append(time.perf_counter() - start)
+
+        self.assertLess(statistics.median(timings), 0.005)
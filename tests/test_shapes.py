@@ -0,0 +1,157 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from www.helpers.shapes import (
+    NEVER,
+    RouteShapes,
+    build_route_shapes,
+    douglas_peucker,
+    load_route_shapes,
+    metres_per_pixel,
+    select_route_shapes,
+    simplify_shape,
+)
+
+
+def make_shapes():
+    # Shape 1 bends once in the middle, shape 2 is a straight line
+    lat = np.linspace(44.60, 44.70, 101)
+    lon = -63.60 + 0.01 * (1 - np.abs(np.linspace(-1, 1, 101)))
+    return pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "shape_id": "1",
+                    "shape_pt_lat": lat,
+                    "shape_pt_lon": lon,
+                    "shape_pt_sequence": np.arange(1, 102),
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "shape_id": "2",
+                    "shape_pt_lat": lat,
+                    "shape_pt_lon": np.full(101, -63.50),
+                    "shape_pt_sequence": np.arange(1, 102),
+                }
+            ),
+        ]
+    ).sample(frac=1, random_state=0)
+
+
+TRIPS = pd.DataFrame(
+    {
+        "route_id": ["1", "1", "1", "2"],
+        "direction_id": [0, 0, 0, 1],
+        "trip_id": ["a", "b", "c", "d"],
+        "shape_id": ["1", "1", "2", "2"],
+    }
+)
+
+
+class TestShapes(unittest.TestCase):
+    def test_douglas_peucker(self):
+        straight = np.column_stack([np.arange(10.0), np.zeros(10)])
+        self.assertEqual(
+            np.flatnonzero(douglas_peucker(straight, 0.1)).tolist(), [0, 9]
+        )
+
+        bumped = straight.copy()
+        bumped[4, 1] = 5.0
+        self.assertEqual(
+            np.flatnonzero(douglas_peucker(bumped, 0.1)).tolist(), [0, 3, 4, 5, 9]
+        )
+        # The bump is within a large tolerance
+        self.assertEqual(np.flatnonzero(douglas_peucker(bumped, 10)).tolist(), [0, 9])
+
+        self.assertEqual(douglas_peucker(np.empty((0, 2)), 1.0).tolist(), [])
+
+    def test_douglas_peucker_closed_loop(self):
+        loop = np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+        self.assertTrue(douglas_peucker(loop, 0.1).all())
+
+    def test_metres_per_pixel(self):
+        self.assertAlmostEqual(metres_per_pixel(0, 0), 156543.03, places=1)
+        self.assertAlmostEqual(metres_per_pixel(1, 60), 156543.03 / 4, places=1)
+
+    def test_simplify_shape_levels_are_nested(self):
+        rng = np.random.default_rng(0)
+        lat = 44.6 + np.cumsum(rng.normal(0, 1e-4, 500))
+        lon = -63.6 + np.cumsum(rng.normal(0, 1e-4, 500))
+
+        min_zoom = simplify_shape(lat, lon, zoom_levels=(10, 13, 16))
+
+        counts = [np.count_nonzero(min_zoom <= zoom) for zoom in (10, 13, 16)]
+        self.assertTrue(counts[0] < counts[1] < counts[2] <= 500)
+        # Endpoints are drawn at every level
+        self.assertEqual(min_zoom[0], 10)
+        self.assertEqual(min_zoom[-1], 10)
+        self.assertTrue(set(np.unique(min_zoom)) <= {10, 13, 16, NEVER})
+
+    def test_select_route_shapes(self):
+        result = select_route_shapes(TRIPS)
+        self.assertEqual(result["route_id"].tolist(), ["1", "2"])
+        self.assertEqual(result["shape_id"].tolist(), ["1", "2"])
+
+    def test_route_shapes(self):
+        route_shapes = RouteShapes.from_frames(
+            make_shapes(), TRIPS, zoom_levels=(10, 16)
+        )
+
+        self.assertEqual(route_shapes.level_for_zoom(4), 10)
+        self.assertEqual(route_shapes.level_for_zoom(12.5), 10)
+        self.assertEqual(route_shapes.level_for_zoom(18), 16)
+
+        lines = route_shapes.lines(12)
+        self.assertEqual([route_id for route_id, _ in lines], ["1", "2"])
+        bent, straight = lines[0][1], lines[1][1]
+        self.assertEqual(bent, [[44.6, -63.6], [44.65, -63.59], [44.7, -63.6]])
+        self.assertEqual(straight, [[44.6, -63.5], [44.7, -63.5]])
+
+        # Lines are reused for every zoom within the same level
+        self.assertIs(route_shapes.lines(13), lines)
+
+    def test_save_and_load(self):
+        route_shapes = RouteShapes.from_frames(make_shapes(), TRIPS)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "shapes_lod.npz"
+            self.assertIsNone(RouteShapes.load(path, "abc"))
+
+            route_shapes.save(path, "abc")
+            loaded = RouteShapes.load(path, "abc")
+            self.assertEqual(loaded.lines(16), route_shapes.lines(16))
+            self.assertEqual(loaded.zoom_levels, route_shapes.zoom_levels)
+
+            # A new static feed invalidates the cache
+            self.assertIsNone(RouteShapes.load(path, "def"))
+
+    def test_load_route_shapes_reloads_new_feed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shapes_path = str(Path(temp_dir) / "shapes.txt")
+            trips_path = str(Path(temp_dir) / "trips.txt")
+            cache_path = str(Path(temp_dir) / "shapes_lod.npz")
+            shapes = make_shapes()
+            shapes.to_csv(shapes_path, index=False)
+            TRIPS.to_csv(trips_path, index=False)
+
+            paths = (shapes_path, trips_path, cache_path)
+            # Loading never simplifies, the refresher builds the cache first
+            self.assertIsNone(load_route_shapes(*paths))
+            build_route_shapes(*paths)
+            route_shapes = load_route_shapes(*paths)
+            self.assertEqual(len(route_shapes.lines(16)), 2)
+            self.assertIs(load_route_shapes(*paths), route_shapes)
+
+            # Route 2 switches to the bent shape in the next static feed
+            trips = TRIPS.assign(shape_id=["1", "1", "2", "1"])
+            trips.to_csv(trips_path, index=False)
+            self.assertIsNone(load_route_shapes(*paths))
+            build_route_shapes(*paths)
+            updated = load_route_shapes(*paths)
+            self.assertIsNot(updated, route_shapes)
+            self.assertEqual(len(updated.lines(16)[1][1]), 3)
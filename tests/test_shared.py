@@ -0,0 +1,229 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from www.helpers.shared import (
+    SharedSnapshotStore,
+    prune_shared_snapshots,
+    read_manifest,
+    read_shared_snapshot,
+    write_shared_snapshot,
+)
+from www.helpers.utilities import get_stop_arrivals
+
+SAMPLE_DATA = {
+    "merged_df": pa.Table.from_pandas(
+        pd.DataFrame(
+            {
+                "stop_id": ["1", "2"],
+                "arrival_time": [pd.Timestamp("2024-01-01 12:00"), pd.NaT],
+                "arrival_difference_minutes": [1.5, None],
+            }
+        )
+    ),
+    "median_delays": pa.table({"route_id": ["1"], "arrival_difference_minutes": [1.5]}),
+    "histogram_data": pa.table({"value": [1.5]}),
+}
+
+
+def record_fetch(directory):
+    # Append-only log of which process fetched, shared by all workers
+    with open(Path(directory) / "fetches.log", "a") as log:
+        log.write(f"{os.getpid()}\n")
+    return SAMPLE_DATA
+
+
+def run_worker(directory, barrier, results):
+    store = SharedSnapshotStore(
+        directory,
+        role="auto",
+        fetch=lambda: record_fetch(directory),
+        interval_secs=60,
+        poll_interval_secs=0.05,
+    )
+    store.start()
+    snapshot = store.current(timeout=10)
+    # Keep every worker alive until all of them have seen a snapshot, otherwise
+    # an early exit lets another worker take over as leader
+    barrier.wait(timeout=10)
+    results.put(
+        (
+            os.getpid(),
+            store.is_leader,
+            snapshot.version,
+            snapshot.data["histogram_data"]["value"].to_pylist(),
+        )
+    )
+    barrier.wait(timeout=10)
+    store.stop()
+
+
+class TestSharedSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        write_shared_snapshot(self.directory, SAMPLE_DATA, 5, 123.0)
+
+        manifest = read_manifest(self.directory)
+        self.assertEqual(manifest["version"], 5)
+        self.assertEqual(manifest["created_at"], 123.0)
+
+        data = read_shared_snapshot(self.directory, manifest)
+        self.assertTrue(all(isinstance(table, pa.Table) for table in data.values()))
+        self.assertEqual(data["histogram_data"]["value"].to_pylist(), [1.5])
+        self.assertTrue(data["median_delays"].equals(SAMPLE_DATA["median_delays"]))
+        merged_df = data["merged_df"].to_pandas()
+        self.assertEqual(merged_df["stop_id"].tolist(), ["1", "2"])
+        self.assertTrue(pd.isna(merged_df["arrival_time"].iloc[1]))
+
+    def test_prune_keeps_latest(self):
+        for version in (1, 2, 3, 4):
+            write_shared_snapshot(self.directory, SAMPLE_DATA, version, 0.0)
+
+        prune_shared_snapshots(self.directory, keep=2)
+
+        remaining = sorted(p.name for p in self.directory.iterdir() if p.is_dir())
+        self.assertEqual(remaining, ["3", "4"])
+
+    def test_single_leader_and_takeover(self):
+        leader = SharedSnapshotStore(
+            self.directory, fetch=lambda: SAMPLE_DATA, interval_secs=60
+        )
+        follower = SharedSnapshotStore(
+            self.directory, fetch=lambda: 1 / 0, interval_secs=60
+        )
+        self.assertTrue(leader.is_leader)
+        self.assertFalse(follower.is_leader)
+
+        # The follower only sees a snapshot once the leader has published one
+        self.assertIsNone(follower.refresh())
+        snapshot = leader.refresh()
+        self.assertEqual(follower.refresh().version, snapshot.version)
+        # Both publish the same memory-mapped Arrow tables
+        for key, table in follower.latest().data.items():
+            self.assertTrue(table.equals(snapshot.data[key]))
+
+        leader.stop()
+        # The new leader reuses the fresh snapshot rather than fetching again
+        self.assertEqual(follower.refresh().version, snapshot.version)
+        self.assertTrue(follower.is_leader)
+        follower.stop()
+
+    def test_restart_serves_checkpoint_before_fetching(self):
+        first = SharedSnapshotStore(
+            self.directory, fetch=lambda: SAMPLE_DATA, interval_secs=60
+        )
+        checkpoint = first.refresh()
+        first.stop()
+
+        # A restarted worker whose fetch is stuck still has the last snapshot
+        release = threading.Event()
+        prepared = threading.Event()
+        restarted = SharedSnapshotStore(
+            self.directory,
+            fetch=lambda: release.wait(10) and SAMPLE_DATA,
+            interval_secs=60,
+        )
+        restarted.start(prepare=prepared.set)
+        try:
+            # Restored by the time start returns
+            snapshot = restarted.latest()
+            self.assertEqual(snapshot.version, checkpoint.version)
+            self.assertEqual(
+                snapshot.data["histogram_data"]["value"].to_pylist(), [1.5]
+            )
+            self.assertTrue(prepared.wait(5))
+        finally:
+            release.set()
+            restarted.stop()
+
+    def test_restored_snapshot_etas_are_current(self):
+        # A checkpoint fetched three hours ago, with the ETAs of that moment
+        fetched_at = pd.Timestamp.now() - pd.Timedelta(hours=3)
+        merged_df = pd.DataFrame(
+            {
+                "stop_name": ["Stop A", "Stop A", "Stop B"],
+                "route_id": ["1", "2", "1"],
+                "trip_headsign": ["1 Downtown", "2 Airport", "1 Downtown"],
+                "arrival_time": [
+                    fetched_at + pd.Timedelta(minutes=5),
+                    fetched_at + pd.Timedelta(minutes=190),
+                    fetched_at + pd.Timedelta(minutes=30),
+                ],
+                "arrival_time_minutes_from_now": [5.0, 190.0, 30.0],
+                "arrival_difference_minutes": [1.0, 2.0, 0.0],
+            }
+        )
+        write_shared_snapshot(
+            self.directory,
+            {"merged_df": pa.Table.from_pandas(merged_df)},
+            version=1,
+            created_at=fetched_at.timestamp(),
+        )
+
+        restarted = SharedSnapshotStore(
+            self.directory, fetch=lambda: 1 / 0, interval_secs=3600
+        )
+        restarted.start()
+        try:
+            arrivals = get_stop_arrivals(restarted.latest().data["merged_df"], "Stop A")
+        finally:
+            restarted.stop()
+
+        self.assertEqual(arrivals["route_id"].tolist(), ["1", "2"])
+        etas = arrivals["arrival_time_minutes_from_now"].tolist()
+        self.assertAlmostEqual(etas[0], -175, delta=1)
+        self.assertAlmostEqual(etas[1], 10, delta=1)
+
+    def test_follower_role_never_leads(self):
+        follower = SharedSnapshotStore(
+            self.directory, role="follower", fetch=lambda: 1 / 0, interval_secs=0
+        )
+        self.assertFalse(follower.is_leader)
+        self.assertIsNone(follower.refresh())
+
+    def test_invalid_role(self):
+        with self.assertRaises(ValueError):
+            SharedSnapshotStore(self.directory, role="primary")
+
+    def test_multiple_worker_processes(self):
+        context = multiprocessing.get_context("spawn")
+        workers = 3
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+
+        processes = [
+            context.Process(
+                target=run_worker, args=(str(self.directory), barrier, results)
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        deadline = time.time() + 30
+        seen = [results.get(timeout=max(0, deadline - time.time())) for _ in processes]
+        for process in processes:
+            process.join(timeout=10)
+            self.assertEqual(process.exitcode, 0)
+
+        leaders = [pid for pid, is_leader, _, _ in seen if is_leader]
+        self.assertEqual(len(leaders), 1)
+        self.assertEqual(len({version for _, _, version, _ in seen}), 1)
+        self.assertTrue(all(values == [1.5] for *_, values in seen))
+
+        # Only the leader ever fetched the feed
+        fetches = (self.directory / "fetches.log").read_text().split()
+        self.assertEqual(fetches, [str(leaders[0])])
@@ -0,0 +1,49 @@
+import unittest
+
+from www.helpers.snapshot import SnapshotStore
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def test_refresh_publishes_increasing_versions(self):
+        calls = []
+
+        def fetch():
+            calls.append(len(calls))
+            return {"call": len(calls)}
+
+        store = SnapshotStore(fetch=fetch, interval_secs=60)
+        self.assertEqual(store.version, 0)
+        self.assertIsNone(store.latest())
+
+        first = store.refresh()
+        second = store.refresh()
+
+        self.assertGreater(second.version, first.version)
+        self.assertEqual(store.version, second.version)
+        self.assertEqual(store.current().data, {"call": 2})
+        self.assertEqual(len(calls), 2)
+
+    def test_current_times_out_without_snapshot(self):
+        store = SnapshotStore(fetch=dict, interval_secs=60)
+        with self.assertRaises(TimeoutError):
+            store.current(timeout=0.01)
+
+    def test_listeners_are_notified(self):
+        store = SnapshotStore(fetch=dict, interval_secs=60)
+        seen = []
+        store.add_listener(lambda snapshot: seen.append(snapshot.version))
+
+        # A failing listener must not stop the snapshot from being published
+        store.add_listener(lambda snapshot: 1 / 0)
+
+        snapshot = store.refresh()
+        self.assertEqual(seen, [snapshot.version])
+        self.assertIs(store.latest(), snapshot)
+
+    def test_background_refresh(self):
+        store = SnapshotStore(fetch=lambda: {"ok": True}, interval_secs=60)
+        store.start()
+        try:
+            self.assertEqual(store.current(timeout=5).data, {"ok": True})
+        finally:
+            store.stop()
@@ -1,16 +1,25 @@
+import os
+import tempfile
 import unittest
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
 
 from www.helpers.utilities import (
     calculate_time_difference,
     convert_to_minutes_from_now,
+    describe_data_age,
     get_stop_info,
     process_stop_times_date,
+    rows_for_stop,
     stringify_trips_and_stops,
     get_time_value_in_minutes,
     generate_styles,
+    get_delay_color,
+    replace_atomically,
+    static_feed_hash,
 )
 
 
@@ -55,6 +64,19 @@ class TestUtilities(unittest.TestCase):
         result = get_stop_info(empty_df, "Stop A")
         self.assertTrue(result.empty)
 
+    def test_rows_for_stop(self):
+        table = pa.table(
+            {
+                "stop_name": ["Stop A", "Stop B", None, "Stop A"],
+                "route_id": ["1", "2", "3", "4"],
+                "stop_lat": [44.6, 44.7, 44.8, 44.6],
+            }
+        )
+        result = rows_for_stop(table, "Stop A", ["stop_name", "route_id"])
+        self.assertEqual(list(result.columns), ["stop_name", "route_id"])
+        self.assertEqual(result["route_id"].tolist(), ["1", "4"])
+        self.assertTrue(rows_for_stop(table, None, ["route_id"]).empty)
+
     def test_process_stop_times_date(self):
         # Assuming time_str is '05:49:00'
         result = process_stop_times_date("05:49:00")
@@ -85,6 +107,20 @@ class TestUtilities(unittest.TestCase):
         ) + timedelta(days=1)
         self.assertEqual(result, expected_time)
 
+    def test_describe_data_age(self):
+        created_at = datetime(2024, 1, 1, 9, 5).timestamp()
+        self.assertEqual(
+            describe_data_age(created_at, created_at + 20, 15), "Live, updated 09:05"
+        )
+        self.assertEqual(
+            describe_data_age(created_at, created_at + 7 * 60, 15),
+            "Last known data from 09:05 (7 min ago), refreshing",
+        )
+        self.assertEqual(
+            describe_data_age(created_at, created_at + 125 * 60, 15),
+            "Last known data from 09:05 (2 h 5 min ago), refreshing",
+        )
+
     def test_convert_to_minutes_from_now(self):
         now = datetime.now()
         future_time = pd.Series((now + timedelta(minutes=10)))
@@ -227,3 +263,39 @@ class TestUtilities(unittest.TestCase):
         ]
 
         self.assertEqual(styles, expected_styles)
+
+    def test_get_delay_color(self):
+        self.assertEqual(get_delay_color(None), "#808080")
+        self.assertEqual(get_delay_color(float("nan")), "#808080")
+        self.assertEqual(get_delay_color(-3), "#00a000")
+        self.assertEqual(get_delay_color(0.2), "#ffffff")
+        self.assertEqual(get_delay_color(2), "#ffb0b0")
+        self.assertEqual(get_delay_color(5), "#ff6060")
+        self.assertEqual(get_delay_color(12.5), "#ff0000")
+
+    def test_static_feed_hash(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "stops.txt"
+            path.write_text("stop_id\n1\n")
+            feed_hash = static_feed_hash(str(path))
+
+            self.assertEqual(static_feed_hash(str(path)), feed_hash)
+            self.assertNotEqual(static_feed_hash(str(path), settings=(1,)), feed_hash)
+            path.write_text("stop_id\n2\n")
+            self.assertNotEqual(static_feed_hash(str(path)), feed_hash)
+
+    def test_replace_atomically(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "cache.bin"
+            path.write_text("old")
+
+            with self.assertRaises(OSError):
+                with replace_atomically(path) as scratch_path:
+                    scratch_path.write_text("half written")
+                    raise OSError("disk full")
+            self.assertEqual(path.read_text(), "old")
+
+            with replace_atomically(path) as scratch_path:
+                scratch_path.write_text("new")
+            self.assertEqual(path.read_text(), "new")
+            self.assertEqual(os.listdir(directory), ["cache.bin"])
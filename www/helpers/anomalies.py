@@ -0,0 +1,319 @@
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from www.helpers.constants import (
+    ANOMALY_ALERT_HISTORY,
+    ANOMALY_EWMA_ALPHA,
+    ANOMALY_HOURLY_ALPHA,
+    ANOMALY_MIN_DEVIATION_MINUTES,
+    ANOMALY_MIN_SAMPLES,
+    ANOMALY_MIN_STD_MINUTES,
+    ANOMALY_WINDOW_SNAPSHOTS,
+    ANOMALY_Z_THRESHOLD,
+)
+from www.helpers.snapshot import Snapshot
+
+
+class Ewma:
+    """Exponentially weighted mean and variance, updated in O(1).
+
+    Until ``1 / alpha`` values have been seen it is a plain running average,
+    so with a small ``alpha`` the first value doesn't linger in the mean.
+    """
+
+    def __init__(self, alpha: float = ANOMALY_EWMA_ALPHA):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def update(self, value: float):
+        if self.count == 0:
+            self.mean = value
+        else:
+            weight = max(self.alpha, 1 / (self.count + 1))
+            diff = value - self.mean
+            increment = weight * diff
+            self.mean += increment
+            self.variance = (1 - weight) * (self.variance + diff * increment)
+        self.count += 1
+
+
+class RollingWindow:
+    """Mean and standard deviation of the last ``size`` values.
+
+    A ring buffer with running sums, so each update is O(1) however large the
+    window is.
+    """
+
+    def __init__(self, size: int = ANOMALY_WINDOW_SNAPSHOTS):
+        self._values = [0.0] * size
+        self._next = 0
+        self.count = 0
+        self._sum = 0.0
+        self._sum_of_squares = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.count if self.count else math.nan
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return math.nan
+        variance = (self._sum_of_squares - self._sum**2 / self.count) / (self.count - 1)
+        # Running sums can drift slightly negative through rounding
+        return math.sqrt(max(variance, 0.0))
+
+    def update(self, value: float):
+        if self.count == len(self._values):
+            evicted = self._values[self._next]
+            self._sum -= evicted
+            self._sum_of_squares -= evicted * evicted
+        else:
+            self.count += 1
+
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self._sum += value
+        self._sum_of_squares += value * value
+
+
+class P2Quantile:
+    """Streaming quantile estimate in constant memory.
+
+    Implements the P-square algorithm (Jain and Chlamtac, 1985), which tracks
+    five markers instead of storing the observations.
+    """
+
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self.count = 0
+        self._heights: list[float] = []
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [
+            1.0,
+            1 + 2 * quantile,
+            1 + 4 * quantile,
+            3 + 2 * quantile,
+            5.0,
+        ]
+        self._increments = [0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0]
+
+    @property
+    def value(self) -> float:
+        if self.count == 0:
+            return math.nan
+        if self.count < 5:
+            # Exact quantile of the few values seen so far
+            ordered = sorted(self._heights)
+            return ordered[round(self.quantile * (len(ordered) - 1))]
+        return self._heights[2]
+
+    def update(self, value: float):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(value)
+            if self.count == 5:
+                heights.sort()
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+
+        positions = self._positions
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (
+                offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, step: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + step * (h[i + step] - h[i]) / (n[i + step] - n[i])
+
+
+def nan_to_zero(value: float) -> float:
+    return 0.0 if math.isnan(value) else value
+
+
+@dataclass(frozen=True)
+class Anomaly:
+    kind: str
+    key: str
+    version: int
+    hour: int
+    value: float
+    expected: float
+    z_score: float
+
+    @property
+    def message(self) -> str:
+        direction = "later" if self.value > self.expected else "earlier"
+        return (
+            f"{self.kind.capitalize()} {self.key} is running {direction} than usual: "
+            f"median delay {self.value:.0f} min, usually {self.expected:.0f} min "
+            f"at {self.hour:02d}:00"
+        )
+
+
+class DelayStats:
+    """Streaming delay statistics for one route or stop."""
+
+    def __init__(
+        self,
+        window: int = ANOMALY_WINDOW_SNAPSHOTS,
+        alpha: float = ANOMALY_EWMA_ALPHA,
+        hourly_alpha: float = ANOMALY_HOURLY_ALPHA,
+    ):
+        self.recent = RollingWindow(window)
+        self.ewma = Ewma(alpha)
+        self.median = P2Quantile(0.5)
+        self.p90 = P2Quantile(0.9)
+        # Baseline for each hour of the day, since delays follow the schedule.
+        # Each one spans days, where ``ewma`` follows the last few snapshots
+        self.hourly = [Ewma(hourly_alpha) for _ in range(24)]
+
+    def update(self, value: float, hour: int):
+        self.recent.update(value)
+        self.ewma.update(value)
+        self.median.update(value)
+        self.p90.update(value)
+        self.hourly[hour].update(value)
+
+
+class AnomalyDetector:
+    """Flags routes and stops whose delay departs from their usual behaviour.
+
+    Each snapshot updates per-route and per-stop statistics in place, so the
+    cost per snapshot depends on the number of routes and stops, never on how
+    much history has been seen.
+    """
+
+    def __init__(
+        self,
+        z_threshold: float = ANOMALY_Z_THRESHOLD,
+        min_deviation: float = ANOMALY_MIN_DEVIATION_MINUTES,
+        min_samples: int = ANOMALY_MIN_SAMPLES,
+        min_std: float = ANOMALY_MIN_STD_MINUTES,
+        history: int = ANOMALY_ALERT_HISTORY,
+    ):
+        self.z_threshold = z_threshold
+        self.min_deviation = min_deviation
+        self.min_samples = min_samples
+        self.min_std = min_std
+        self.routes: dict[str, DelayStats] = {}
+        self.stops: dict[str, DelayStats] = {}
+        self._alerts: deque[Anomaly] = deque(maxlen=history)
+        self._alerts_lock = threading.Lock()
+
+    def check(self, stats: DelayStats, value: float, hour: int) -> Optional[tuple]:
+        baseline = stats.hourly[hour]
+        if baseline.count < self.min_samples:
+            return None
+
+        deviation = value - baseline.mean
+        # A swing no bigger than the ones of the last few snapshots isn't news,
+        # however steady this hour has been on other days
+        spread = max(baseline.std, nan_to_zero(stats.recent.std), self.min_std)
+        z_score = deviation / spread
+        # Nor is a delay within the route's usual median to 90th percentile gap
+        min_deviation = max(
+            self.min_deviation, nan_to_zero(stats.p90.value - stats.median.value)
+        )
+        if abs(z_score) >= self.z_threshold and abs(deviation) >= min_deviation:
+            return baseline.mean, z_score
+        return None
+
+    def update(self, snapshot: Snapshot) -> list[Anomaly]:
+        hour = datetime.fromtimestamp(snapshot.created_at).hour
+
+        median_delays_df = snapshot.data["median_delays"].to_pandas()
+        route_delays = zip(
+            median_delays_df["route_id"].astype(str),
+            median_delays_df["arrival_difference_minutes"],
+        )
+
+        # Stops only get the current snapshot's median, history is never rescanned
+        delays_heatmap_df = snapshot.data["delays_heatmap_data"].to_pandas()
+        # Delays carried downstream would repeat one late trip at every later stop.
+        # Checkpoints from before propagation have no such column
+        if "propagated" in delays_heatmap_df:
+            delays_heatmap_df = delays_heatmap_df[~delays_heatmap_df["propagated"]]
+        stop_medians = delays_heatmap_df.groupby("stop_id")[
+            "arrival_difference_minutes"
+        ].median()
+        stop_delays = zip(stop_medians.index.astype(str), stop_medians.to_numpy())
+
+        anomalies = []
+        for kind, all_stats, delays in (
+            ("route", self.routes, route_delays),
+            ("stop", self.stops, stop_delays),
+        ):
+            for key, value in delays:
+                if pd.isna(value):
+                    continue
+                value = float(value)
+
+                stats = all_stats.get(key)
+                if stats is None:
+                    stats = all_stats[key] = DelayStats()
+
+                # Score against the baseline before it learns from this value
+                flagged = self.check(stats, value, hour)
+                if flagged is not None:
+                    expected, z_score = flagged
+                    anomalies.append(
+                        Anomaly(
+                            kind, key, snapshot.version, hour, value, expected, z_score
+                        )
+                    )
+                stats.update(value, hour)
+
+        with self._alerts_lock:
+            self._alerts.extend(anomalies)
+        return anomalies
+
+    def alerts_since(self, version: int, kind: Optional[str] = None) -> list[Anomaly]:
+        with self._alerts_lock:
+            return [
+                anomaly
+                for anomaly in self._alerts
+                if anomaly.version > version and (kind is None or anomaly.kind == kind)
+            ]
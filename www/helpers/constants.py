@@ -1,7 +1,56 @@
+import os
+
 CONTAINER_HEIGHT = "85vh"
-STATIC_URL = "https://gtfs.halifax.ca/static/google_transit.zip"
-FEED_URL = "https://gtfs.halifax.ca/realtime/TripUpdate/TripUpdates.pb"
+# Feed locations can be overridden, e.g. to point at the load test's stub server
+STATIC_URL = os.environ.get(
+    "HALIFAX_STATIC_URL", "https://gtfs.halifax.ca/static/google_transit.zip"
+)
+FEED_URL = os.environ.get(
+    "HALIFAX_FEED_URL", "https://gtfs.halifax.ca/realtime/TripUpdate/TripUpdates.pb"
+)
+STATIC_DATA_DIR = "www/static_data"
 STOP_TIMES_PATH = "www/static_data/stop_times.txt"
 TRIPS_PATH = "www/static_data/trips.txt"
 STOPS_PATH = "www/static_data/stops.txt"
-DATA_REFRESH_INTERVAL_SECONDS = 60
+SHAPES_PATH = "www/static_data/shapes.txt"
+SHAPES_CACHE_PATH = "www/static_data/shapes_lod.npz"
+SCHEDULE_CACHE_DIR = "www/static_data/schedule_cache"
+DATA_REFRESH_INTERVAL_SECONDS = int(
+    os.environ.get("HALIFAX_REFRESH_INTERVAL_SECONDS", 60)
+)
+HISTOGRAM_BINS = 100
+# Delays carried on to stops after a trip's last realtime update halve over this
+# many minutes of scheduled travel; None carries them unchanged
+DELAY_PROPAGATION_HALF_LIFE_MINUTES = None
+
+# Directory worker processes share snapshots through, one leader fetching the
+# feed for all of them. CHECKPOINT_DIR takes its place when unset
+SHARED_SNAPSHOT_DIR = os.environ.get("HALIFAX_SHARED_SNAPSHOT_DIR")
+# One of "auto", "leader" or "follower"
+SNAPSHOT_ROLE = os.environ.get("HALIFAX_SNAPSHOT_ROLE", "auto")
+FOLLOWER_POLL_INTERVAL_SECONDS = 1
+# Last processed snapshot, kept on disk so a restarted worker renders at once.
+# A shared snapshot directory doubles as the checkpoint when it is set
+CHECKPOINT_DIR = os.environ.get("HALIFAX_CHECKPOINT_DIR", "www/checkpoint")
+DATA_AGE_UPDATE_SECONDS = 30
+STOP_SEARCH_LIMIT = 50
+# Map zoom levels with precomputed route shape geometry, and the simplification
+# tolerance in screen pixels at each of them
+SHAPE_ZOOM_LEVELS = (10, 12, 14, 16)
+SHAPE_TOLERANCE_PIXELS = 1.0
+
+# Streaming delay anomaly detection
+ANOMALY_EWMA_ALPHA = 0.05
+ANOMALY_WINDOW_SNAPSHOTS = 60
+ANOMALY_Z_THRESHOLD = 3.0
+ANOMALY_MIN_DEVIATION_MINUTES = 5
+ANOMALY_MIN_STD_MINUTES = 1.0
+# Hour-of-day baselines average that hour over about this many days, so a bad
+# afternoon can't redefine what is usual for the afternoon
+ANOMALY_BASELINE_DAYS = 14
+ANOMALY_HOURLY_ALPHA = DATA_REFRESH_INTERVAL_SECONDS / (3600 * ANOMALY_BASELINE_DAYS)
+# Snapshots seen at an hour of the day before that hour's baseline is trusted,
+# two days' worth, so one day's samples are never the whole baseline
+ANOMALY_MIN_SAMPLES = 2 * 3600 // DATA_REFRESH_INTERVAL_SECONDS
+ANOMALY_ALERT_HISTORY = 500
+ANOMALY_NOTIFICATION_SECONDS = 30
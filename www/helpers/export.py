@@ -0,0 +1,265 @@
+import gzip
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+import brotli
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from www.helpers.constants import HISTOGRAM_BINS
+from www.helpers.snapshot import Snapshot, SnapshotStore
+
+EXPORT_TABLES = ("route_medians", "stop_delays", "histogram")
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Preferred order when a client accepts several encodings equally
+ENCODINGS = ("br", "gzip")
+
+
+@dataclass(frozen=True)
+class Payload:
+    body: bytes
+    media_type: str
+    etag: str
+
+
+def build_route_medians(data: dict) -> pd.DataFrame:
+    route_medians = data["median_delays"].to_pandas()
+    route_medians = route_medians.rename(
+        columns={"arrival_difference_minutes": "median_delay_minutes"}
+    )
+    return route_medians.sort_values("route_id").reset_index(drop=True)
+
+
+def build_stop_delays(data: dict) -> pd.DataFrame:
+    columns = [
+        "stop_id",
+        "stop_name",
+        "stop_lat",
+        "stop_lon",
+        "arrival_difference_minutes",
+        "propagated",
+    ]
+    merged_df = data["merged_df"]
+    merged_df = merged_df.select(
+        [column for column in columns if column in merged_df.column_names]
+    ).to_pandas()
+    merged_df = merged_df.dropna(subset=["stop_id", "arrival_difference_minutes"])
+    # Observations are delays Halifax published, not ones carried downstream
+    if "propagated" in merged_df:
+        merged_df = merged_df[~merged_df["propagated"]]
+
+    stop_delays = (
+        merged_df.groupby("stop_id")
+        .agg(
+            stop_name=("stop_name", "first"),
+            stop_lat=("stop_lat", "first"),
+            stop_lon=("stop_lon", "first"),
+            median_delay_minutes=("arrival_difference_minutes", "median"),
+            observations=("arrival_difference_minutes", "size"),
+        )
+        .reset_index()
+    )
+    return stop_delays
+
+
+def build_histogram(data: dict) -> pd.DataFrame:
+    delays = np.asarray(data["histogram_data"]["value"], dtype=float)
+    if delays.size == 0:
+        return pd.DataFrame(
+            {"bin_start": [], "bin_end": [], "count": pd.Series([], dtype="int64")}
+        )
+
+    counts, edges = np.histogram(delays, bins=HISTOGRAM_BINS)
+    return pd.DataFrame(
+        {"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts}
+    )
+
+
+TABLE_BUILDERS = {
+    "route_medians": build_route_medians,
+    "stop_delays": build_stop_delays,
+    "histogram": build_histogram,
+}
+
+
+def serialize_table(df: pd.DataFrame, fmt: str, snapshot: Snapshot) -> bytes:
+    if fmt == "json":
+        generated_at = datetime.fromtimestamp(snapshot.created_at, timezone.utc)
+        # to_json already takes care of NaN -> null and numpy scalar types
+        return (
+            f'{{"version":{snapshot.version},'
+            f'"generated_at":"{generated_at.isoformat()}",'
+            f'"data":{df.to_json(orient="records")}}}'
+        ).encode("utf-8")
+
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+
+    if fmt == "arrow":
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), b"version": str(snapshot.version)}
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 keeps the output byte-for-byte stable for a given body
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=9)
+    if encoding == "identity":
+        return body
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def build_payloads(snapshot: Snapshot) -> dict:
+    payloads = {}
+    for table_name, builder in TABLE_BUILDERS.items():
+        df = builder(snapshot.data)
+        for fmt, media_type in MEDIA_TYPES.items():
+            body = serialize_table(df, fmt, snapshot)
+            # Weak validator: the representation differs per encoding, but the
+            # content is the same for a given snapshot version
+            etag = f'W/"{snapshot.version}-{table_name}-{fmt}"'
+            for encoding in ("identity",) + ENCODINGS:
+                payloads[(table_name, fmt, encoding)] = Payload(
+                    body=compress(body, encoding), media_type=media_type, etag=etag
+                )
+    return payloads
+
+
+class ExportCache:
+    """Serialized and compressed export bodies for the latest snapshot version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Swapped as one tuple so readers never pair a version with stale bodies
+        self._built: tuple[int, dict] = (0, {})
+
+    def get(self, version: int) -> Optional[dict]:
+        built_version, payloads = self._built
+        if built_version == version:
+            return payloads
+        return None
+
+    def build(self, snapshot: Snapshot) -> dict:
+        with self._lock:
+            # Another thread may have built this version while we were waiting
+            built_version, payloads = self._built
+            if built_version == snapshot.version:
+                return payloads
+            payloads = build_payloads(snapshot)
+            self._built = (snapshot.version, payloads)
+            return payloads
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison function (RFC 9110 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def create_export_app(store: SnapshotStore) -> Starlette:
+    cache = ExportCache()
+    # Serialize and compress in the refresher thread, off the request path
+    store.add_listener(cache.build)
+
+    async def index(request: Request) -> Response:
+        snapshot = store.latest()
+        return JSONResponse(
+            {
+                "version": snapshot.version if snapshot is not None else None,
+                "tables": list(EXPORT_TABLES),
+                "formats": list(MEDIA_TYPES),
+            }
+        )
+
+    async def export_table(request: Request) -> Response:
+        table_name = request.path_params["table"]
+        fmt = request.path_params["fmt"]
+        if table_name not in EXPORT_TABLES or fmt not in MEDIA_TYPES:
+            return Response(status_code=404)
+
+        snapshot = store.latest()
+        if snapshot is None:
+            return Response(status_code=503, headers={"Retry-After": "5"})
+
+        payloads = cache.get(snapshot.version)
+        if payloads is None:
+            payloads = await run_in_threadpool(cache.build, snapshot)
+
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        payload = payloads[(table_name, fmt, encoding)]
+
+        max_age = max(0, int(store.interval_secs - snapshot.age_seconds))
+        headers = {
+            "ETag": payload.etag,
+            "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+            "Vary": "Accept-Encoding",
+            "X-Snapshot-Version": str(snapshot.version),
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, payload.etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(payload.body, media_type=payload.media_type, headers=headers)
+
+    return Starlette(
+        routes=[
+            Route("/", index),
+            Route("/{table}.{fmt}", export_table),
+        ]
+    )
@@ -1,33 +1,57 @@
 import io
+import os
+import tempfile
 import urllib.request
 import zipfile
 from datetime import datetime
 
 import pandas as pd
+import pyarrow as pa
 from google.transit import gtfs_realtime_pb2
 
-from www.helpers.constants import FEED_URL, STOP_TIMES_PATH, STOPS_PATH, TRIPS_PATH
+from www.helpers.constants import (
+    DELAY_PROPAGATION_HALF_LIFE_MINUTES,
+    FEED_URL,
+    STATIC_DATA_DIR,
+    STATIC_URL,
+)
+from www.helpers.propagation import propagate_delays
+from www.helpers.schedule import load_static_schedule
+from www.helpers.shapes import build_route_shapes
 from www.helpers.utilities import (
     calculate_time_difference,
-    convert_to_minutes_from_now,
     get_time_value_in_minutes,
-    process_stop_times_date,
     stringify_trips_and_stops,
 )
-from www.helpers.schemas import (
-    real_time_schema,
-    trips_schema,
-    stops_schema,
-    stop_times_schema,
-)
+from www.helpers.schemas import real_time_schema
 
 
 def download_and_extract_zip(url, extract_to="."):
     with urllib.request.urlopen(url) as response:
         zip_data = response.read()
 
-    with zipfile.ZipFile(io.BytesIO(zip_data)) as z:
-        z.extractall(path=extract_to)
+    # Extract next to the destination and rename each file into place, so a
+    # refresh reading the previous feed never sees a half-written file
+    os.makedirs(extract_to, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=extract_to) as scratch_dir:
+        with zipfile.ZipFile(io.BytesIO(zip_data)) as z:
+            z.extractall(path=scratch_dir)
+            for name in z.namelist():
+                if not name.endswith("/"):
+                    destination = os.path.join(extract_to, name)
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    os.replace(os.path.join(scratch_dir, name), destination)
+
+
+def download_static_feed():
+    download_and_extract_zip(STATIC_URL, STATIC_DATA_DIR)
+
+
+def prepare_static_feed():
+    # Runs in the snapshot refresher before its first fetch, so simplifying the
+    # route shapes of a new feed never holds up a render
+    download_static_feed()
+    build_route_shapes()
 
 
 def get_realtime_transit_feed(pb_url: str):
@@ -75,26 +99,14 @@ def fetch_and_process_data() -> dict:
     feed = get_realtime_transit_feed(pb_url)
     realtime_data = parse_feed(feed)
 
-    stop_times = pd.read_csv(STOP_TIMES_PATH)
-    trips = pd.read_csv(TRIPS_PATH)
-    stops = pd.read_csv(STOPS_PATH)
+    # Parsed and validated once per static feed rather than on every refresh
+    schedule = load_static_schedule()
+    stop_times = schedule.stop_times_on(datetime.now())
+    trips = schedule.trips
+    stops = schedule.stops
 
-    stop_times["arrival_time"] = stop_times["arrival_time"].apply(
-        process_stop_times_date
-    )
-    stop_times["departure_time"] = stop_times["departure_time"].apply(
-        process_stop_times_date
-    )
-
-    stringify_trips_and_stops(stop_times)
     stringify_trips_and_stops(realtime_data)
-    stringify_trips_and_stops(trips)
-    stringify_trips_and_stops(stops)
-
     real_time_schema.validate(realtime_data)
-    stops_schema.validate(stops)
-    trips_schema.validate(trips)
-    stop_times_schema.validate(stop_times)
 
     merged_df = pd.merge(
         realtime_data,
@@ -104,17 +116,6 @@ def fetch_and_process_data() -> dict:
         suffixes=("", "_expected"),
     )
 
-    merged_df = pd.merge(
-        merged_df,
-        stops[["stop_id", "stop_name", "stop_lat", "stop_lon"]],
-        on="stop_id",
-        how="left",
-    )
-
-    merged_df = pd.merge(
-        merged_df, trips[["trip_id", "trip_headsign"]], on=["trip_id"], how="left"
-    )
-
     datetime_columns = [
         "arrival_time",
         "departure_time",
@@ -125,8 +126,27 @@ def fetch_and_process_data() -> dict:
     for column in datetime_columns:
         merged_df[column] = pd.to_datetime(merged_df[column], errors="coerce")
 
-    merged_df["arrival_time_minutes_from_now"] = convert_to_minutes_from_now(
-        merged_df["arrival_time"]
+    # Predictions often stop partway through a trip; fill in its remaining stops
+    # from the trip's latest delay, flagged as propagated
+    propagated_df = propagate_delays(
+        merged_df,
+        stop_times,
+        schedule.propagator,
+        DELAY_PROPAGATION_HALF_LIFE_MINUTES,
+    )
+    merged_df["propagated"] = False
+    propagated_df["propagated"] = True
+    merged_df = pd.concat([merged_df, propagated_df], ignore_index=True)
+
+    merged_df = pd.merge(
+        merged_df,
+        stops[["stop_id", "stop_name", "stop_lat", "stop_lon"]],
+        on="stop_id",
+        how="left",
+    )
+
+    merged_df = pd.merge(
+        merged_df, trips[["trip_id", "trip_headsign"]], on=["trip_id"], how="left"
     )
 
     merged_df["arrival_difference"] = calculate_time_difference(
@@ -152,30 +172,32 @@ def fetch_and_process_data() -> dict:
         & (merged_df["arrival_difference_minutes"] >= -1440)
     ]
 
+    # Route medians and the histogram only count delays Halifax published
+    observed_df = merged_df[~merged_df["propagated"]]
     median_delays = (
-        merged_df.groupby("route_id")["arrival_difference_minutes"]
+        observed_df.groupby("route_id")["arrival_difference_minutes"]
         .median()
         .reset_index()
     )
 
-    median_delays_dict = median_delays.to_dict(orient="list")
-
-    merged_df_dict = merged_df.to_dict(orient="list")
-
-    histogram_data = merged_df["arrival_difference_minutes"].dropna().tolist()
-    delays_heatmap_data = (
-        merged_df[["stop_id", "stop_lat", "stop_lon", "arrival_difference_minutes"]]
-        .dropna(
-            subset=["stop_id", "stop_lat", "stop_lon", "arrival_difference_minutes"]
-        )
-        .to_dict(orient="list")
-    )
-    stop_names = sorted(merged_df["stop_name"].dropna().unique().tolist())
-
+    histogram_data = observed_df["arrival_difference_minutes"].dropna()
+    delays_heatmap_data = merged_df[
+        [
+            "stop_id",
+            "stop_lat",
+            "stop_lon",
+            "arrival_difference_minutes",
+            "propagated",
+        ]
+    ].dropna(subset=["stop_id", "stop_lat", "stop_lon", "arrival_difference_minutes"])
+
+    # Arrow tables, which renders slice and convert rather than copying whole;
+    # lists are a single "value" column
     return {
-        "merged_df": merged_df_dict,
-        "median_delays": median_delays_dict,
-        "histogram_data": histogram_data,
-        "stop_names": stop_names,
-        "delays_heatmap_data": delays_heatmap_data,
+        "merged_df": pa.Table.from_pandas(merged_df, preserve_index=False),
+        "median_delays": pa.Table.from_pandas(median_delays, preserve_index=False),
+        "histogram_data": pa.table({"value": histogram_data.to_numpy()}),
+        "delays_heatmap_data": pa.Table.from_pandas(
+            delays_heatmap_data, preserve_index=False
+        ),
     }
@@ -68,3 +68,15 @@ trips_schema = DataFrameSchema(
     strict=True,
     coerce=True,
 )
+
+shapes_schema = DataFrameSchema(
+    {
+        "shape_id": Column(str),
+        "shape_pt_lat": Column(float),
+        "shape_pt_lon": Column(float),
+        "shape_pt_sequence": Column(int),
+        "shape_dist_traveled": Column(float, nullable=True, required=False),
+    },
+    strict=True,
+    coerce=True,
+)
@@ -0,0 +1,263 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from www.helpers.constants import STOP_SEARCH_LIMIT, STOPS_PATH
+from www.helpers.utilities import file_signature
+
+# Words joining the two streets of an intersection in a stop name,
+# e.g. "Barrington St [Southbound] before Spring Garden Rd"
+INTERSECTION_PATTERN = re.compile(r"\s+(?:before|after|opposite|at|near|and|&|/)\s+")
+QUERY_INTERSECTION_PATTERN = re.compile(r"\s*(?:&|/|@|\band\b|\bat\b)\s*")
+
+# Selectize re-filters loaded options on the client, and keeps the first copy of
+# every option it has loaded, with the query and score of that first request. So
+# each response's ranking is kept per query, and the score function shows the
+# server's matches for the current query in the server's order.
+SELECTIZE_ON_LOAD_JS = """
+function(results) {
+  if (!results || !results.length) return;
+  var scores = {};
+  results.forEach(function(result) { scores[result.value] = result.score; });
+  this.stopSearchScores = this.stopSearchScores || {};
+  this.stopSearchScores[results[0].query] = scores;
+  // The options were refreshed before this handler ran, without these scores
+  this.lastQuery = null;
+  this.refreshOptions(this.isFocused && !this.isInputHidden);
+}
+"""
+SELECTIZE_SCORE_JS = """
+function(search) {
+  var scores = (this.stopSearchScores || {})[search] || {};
+  return function(item) { return scores[item.value] || 0; };
+}
+"""
+
+# Ranking tiers, best first; ties are broken by shorter names
+EXACT_CODE_SCORE = 100
+CODE_PREFIX_SCORE = 90
+NAME_PREFIX_SCORE = 80
+INTERSECTION_SCORE = 70
+TOKEN_PREFIX_SCORE = 60
+FUZZY_SCORE = 50
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+
+def normalize(text: str) -> str:
+    # Lower-case, strip accents and collapse punctuation into single spaces
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def split_intersection(stop_name: str) -> list[str]:
+    # Drop direction tags such as "[Northbound]" before splitting on connectors
+    stop_name = re.sub(r"\[[^\]]*\]", " ", stop_name)
+    streets = [normalize(street) for street in INTERSECTION_PATTERN.split(stop_name)]
+    return [street for street in streets if street]
+
+
+def _prefix_range(sorted_keys: list[str], prefix: str) -> tuple[int, int]:
+    start = bisect_left(sorted_keys, prefix)
+    # "\uffff" sorts after every character that can follow the prefix
+    end = bisect_left(sorted_keys, prefix + "\uffff", lo=start)
+    return start, end
+
+
+class StopSearchIndex:
+    """Prebuilt index answering stop selector queries on the server.
+
+    Matches stop codes and names by prefix, name tokens by prefix, the streets
+    of an intersection (e.g. "barrington & spring garden"), and falls back to
+    trigram similarity for misspellings.
+    """
+
+    def __init__(self, stops: pd.DataFrame):
+        stops = stops.dropna(subset=["stop_name"])
+        # The stop selector's value is the stop name, so stops sharing a name
+        # (e.g. both sides of the street) are a single entry
+        grouped = stops.groupby("stop_name", sort=True)["stop_code"]
+        self.names: list[str] = []
+        self.labels: list[str] = []
+        codes_by_doc: list[list[str]] = []
+        for stop_name, stop_codes in grouped:
+            codes = sorted({str(code) for code in stop_codes.dropna()})
+            self.names.append(stop_name)
+            self.labels.append(
+                f"{stop_name} ({', '.join(codes)})" if codes else stop_name
+            )
+            codes_by_doc.append(codes)
+
+        self._normalized = [normalize(name) for name in self.names]
+        self._name_lengths = np.array([len(name) for name in self._normalized])
+
+        self._sorted_names = sorted(
+            (name, doc) for doc, name in enumerate(self._normalized)
+        )
+        self._sorted_name_keys = [name for name, _ in self._sorted_names]
+
+        self._sorted_codes = sorted(
+            (code, doc) for doc, codes in enumerate(codes_by_doc) for code in codes
+        )
+        self._sorted_code_keys = [code for code, _ in self._sorted_codes]
+
+        token_postings: dict[str, set[int]] = {}
+        street_postings: dict[str, set[int]] = {}
+        trigram_postings: dict[str, list[int]] = {}
+        for doc, (name, normalized) in enumerate(zip(self.names, self._normalized)):
+            for token in normalized.split():
+                token_postings.setdefault(token, set()).add(doc)
+            for street in split_intersection(name):
+                street_postings.setdefault(street, set()).add(doc)
+            for trigram in trigrams(normalized):
+                trigram_postings.setdefault(trigram, []).append(doc)
+
+        self._tokens = sorted(token_postings)
+        self._token_postings = [token_postings[token] for token in self._tokens]
+        self._streets = sorted(street_postings)
+        self._street_postings = [street_postings[street] for street in self._streets]
+        self._trigram_postings = {
+            trigram: np.array(docs, dtype=np.int32)
+            for trigram, docs in trigram_postings.items()
+        }
+        self._trigram_counts = np.array(
+            [len(trigrams(name)) for name in self._normalized], dtype=np.int32
+        )
+
+    @classmethod
+    def from_csv(cls, path: str = STOPS_PATH) -> "StopSearchIndex":
+        stops = pd.read_csv(path, usecols=["stop_name", "stop_code"], dtype=str)
+        return cls(stops)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, query: str, limit: int = STOP_SEARCH_LIMIT) -> list[dict]:
+        normalized = normalize(query)
+        if not normalized:
+            return [
+                self._result(doc, 1 - doc / (limit + 1))
+                for doc in range(min(limit, len(self)))
+            ]
+
+        scores: dict[int, int] = {}
+
+        def add(docs, score):
+            for doc in docs:
+                if scores.get(doc, 0) < score:
+                    scores[doc] = score
+
+        def add_scored(scored_docs):
+            for doc, score in scored_docs:
+                if scores.get(doc, 0) < score:
+                    scores[doc] = score
+
+        if normalized.isdigit():
+            start, end = _prefix_range(self._sorted_code_keys, normalized)
+            for code, doc in self._sorted_codes[start:end]:
+                add(
+                    [doc], EXACT_CODE_SCORE if code == normalized else CODE_PREFIX_SCORE
+                )
+
+        start, end = _prefix_range(self._sorted_name_keys, normalized)
+        add((doc for _, doc in self._sorted_names[start:end]), NAME_PREFIX_SCORE)
+
+        streets = [normalize(part) for part in QUERY_INTERSECTION_PATTERN.split(query)]
+        streets = [street for street in streets if street]
+        if len(streets) > 1:
+            add(
+                self._match_all(streets, self._streets, self._street_postings),
+                INTERSECTION_SCORE,
+            )
+
+        add(
+            self._match_all(normalized.split(), self._tokens, self._token_postings),
+            TOKEN_PREFIX_SCORE,
+        )
+
+        # Only fall back to fuzzy matching for misspelled queries
+        if not scores:
+            add_scored(self._fuzzy_matches(normalized, limit))
+
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], self._name_lengths[item[0]], item[0]),
+        )
+        # Later results get slightly lower scores so the client keeps our order
+        return [
+            self._result(doc, score - rank / (limit + 1))
+            for rank, (doc, score) in enumerate(ranked[:limit])
+        ]
+
+    def _match_all(self, prefixes, sorted_keys, postings) -> set[int]:
+        # Documents where every prefix matches the start of some key
+        matched = None
+        for prefix in prefixes:
+            start, end = _prefix_range(sorted_keys, prefix)
+            docs = set().union(*postings[start:end])
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                return set()
+        return matched
+
+    def _fuzzy_matches(self, normalized: str, limit: int) -> list[tuple[int, float]]:
+        query_trigrams = trigrams(normalized)
+        postings = [
+            self._trigram_postings[trigram]
+            for trigram in query_trigrams
+            if trigram in self._trigram_postings
+        ]
+        if not postings:
+            return []
+
+        shared = np.bincount(np.concatenate(postings), minlength=len(self))
+        # Dice coefficient between the query's and each name's trigrams
+        similarity = 2 * shared / (len(query_trigrams) + self._trigram_counts)
+        candidates = np.flatnonzero(similarity >= MIN_TRIGRAM_SIMILARITY)
+        if len(candidates) > limit:
+            top = np.argpartition(-similarity[candidates], limit)[:limit]
+            candidates = candidates[top]
+        # Scaled below the exact tiers, so better spellings still rank first
+        return [(int(doc), FUZZY_SCORE * float(similarity[doc])) for doc in candidates]
+
+    def _result(self, doc: int, score: float) -> dict:
+        return {"value": self.names[doc], "label": self.labels[doc], "score": score}
+
+
+@lru_cache(maxsize=1)
+def _load_stop_search_index(path: str, signature) -> StopSearchIndex:
+    return StopSearchIndex.from_csv(path)
+
+
+def load_stop_search_index(path: str = STOPS_PATH) -> StopSearchIndex:
+    # Rebuilt when a new static feed replaces the stops file
+    return _load_stop_search_index(path, file_signature(path))
+
+
+async def stop_search_endpoint(request: Request) -> JSONResponse:
+    # Answers selectize's load requests, see update_selectize(server=True)
+    query = request.query_params.get("query", "")
+    try:
+        limit = min(int(request.query_params.get("maxop", "")), STOP_SEARCH_LIMIT)
+    except ValueError:
+        limit = STOP_SEARCH_LIMIT
+
+    try:
+        index = load_stop_search_index()
+    except FileNotFoundError:
+        # The static feed has not been downloaded yet
+        return JSONResponse([])
+
+    results = index.search(query, limit)
+    return JSONResponse([{**result, "query": query} for result in results])
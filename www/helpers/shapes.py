@@ -0,0 +1,284 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from www.helpers.constants import (
+    SHAPE_TOLERANCE_PIXELS,
+    SHAPE_ZOOM_LEVELS,
+    SHAPES_CACHE_PATH,
+    SHAPES_PATH,
+    TRIPS_PATH,
+)
+from www.helpers.schemas import shapes_schema
+from www.helpers.utilities import (
+    file_signature,
+    replace_atomically,
+    static_feed_hash,
+    stringify_trips_and_stops,
+)
+
+EARTH_RADIUS_METRES = 6_378_137
+# Web Mercator ground resolution at the equator for zoom 0, in metres per pixel
+EQUATOR_METRES_PER_PIXEL = 2 * np.pi * EARTH_RADIUS_METRES / 256
+# Sentinel for points dropped at every zoom level
+NEVER = np.iinfo(np.uint8).max
+
+
+def metres_per_pixel(zoom: float, latitude: float) -> float:
+    return EQUATOR_METRES_PER_PIXEL * np.cos(np.radians(latitude)) / 2**zoom
+
+
+def project(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Local equirectangular projection in metres, accurate enough at city scale
+    lat0 = np.radians(lat.mean())
+    x = np.radians(lon) * np.cos(lat0) * EARTH_RADIUS_METRES
+    y = np.radians(lat) * EARTH_RADIUS_METRES
+    return np.column_stack([x, y])
+
+
+def douglas_peucker(xy: np.ndarray, tolerance: float) -> np.ndarray:
+    """Boolean mask of the points kept when simplifying a line to ``tolerance``."""
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[[0, n - 1]] = True
+
+    # Iterative, so long shapes can't hit the recursion limit
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        segment = xy[end] - xy[start]
+        points = xy[start + 1 : end] - xy[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            # Closed loop: fall back to the distance from the start point
+            distances = np.hypot(points[:, 0], points[:, 1])
+        else:
+            cross = segment[0] * points[:, 1] - segment[1] * points[:, 0]
+            distances = np.abs(cross) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return keep
+
+
+def simplify_shape(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    zoom_levels=SHAPE_ZOOM_LEVELS,
+    tolerance_pixels: float = SHAPE_TOLERANCE_PIXELS,
+) -> np.ndarray:
+    """Lowest zoom level at which each point is drawn, ``NEVER`` if it is not.
+
+    Levels are simplified from the most to the least detailed, each one from
+    the previous result, so every level is a subset of the next one and a single
+    byte per point describes all of them.
+    """
+    xy = project(lat, lon)
+    min_zoom = np.full(len(lat), NEVER, dtype=np.uint8)
+    kept = np.arange(len(lat))
+    for zoom in sorted(zoom_levels, reverse=True):
+        tolerance = tolerance_pixels * metres_per_pixel(zoom, float(lat.mean()))
+        kept = kept[douglas_peucker(xy[kept], tolerance)]
+        min_zoom[kept] = zoom
+    return min_zoom
+
+
+def select_route_shapes(trips: pd.DataFrame) -> pd.DataFrame:
+    # The most common shape per route and direction stands in for the route
+    counts = (
+        trips.groupby(["route_id", "direction_id", "shape_id"])
+        .size()
+        .reset_index(name="trip_count")
+        .sort_values(
+            ["route_id", "direction_id", "trip_count", "shape_id"],
+            ascending=[True, True, False, True],
+        )
+    )
+    return counts.drop_duplicates(["route_id", "direction_id"])[
+        ["route_id", "direction_id", "shape_id"]
+    ].reset_index(drop=True)
+
+
+class RouteShapes:
+    """Simplified route geometry for every zoom level, stored compactly.
+
+    Points of all lines are concatenated into float32 arrays, with ``offsets``
+    marking where each line starts and ``min_zoom`` holding the lowest zoom
+    level at which each point is drawn.
+    """
+
+    def __init__(self, route_ids, offsets, lat, lon, min_zoom, zoom_levels):
+        self.route_ids = np.asarray(route_ids, dtype=str)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.min_zoom = np.asarray(min_zoom, dtype=np.uint8)
+        self.zoom_levels = tuple(sorted(int(zoom) for zoom in zoom_levels))
+        self._lines_by_level: dict[int, list] = {}
+
+    @classmethod
+    def from_frames(
+        cls,
+        shapes: pd.DataFrame,
+        trips: pd.DataFrame,
+        zoom_levels=SHAPE_ZOOM_LEVELS,
+        tolerance_pixels: float = SHAPE_TOLERANCE_PIXELS,
+    ) -> "RouteShapes":
+        shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"])
+        points_by_shape = {
+            shape_id: group for shape_id, group in shapes.groupby("shape_id")
+        }
+
+        route_ids, lats, lons, min_zooms, offsets = [], [], [], [], [0]
+        for row in select_route_shapes(trips).itertuples(index=False):
+            points = points_by_shape.get(row.shape_id)
+            if points is None or len(points) < 2:
+                continue
+
+            lat = points["shape_pt_lat"].to_numpy(dtype=float)
+            lon = points["shape_pt_lon"].to_numpy(dtype=float)
+            min_zoom = simplify_shape(lat, lon, zoom_levels, tolerance_pixels)
+            # Points dropped at every zoom level are never needed again
+            drawn = min_zoom != NEVER
+
+            route_ids.append(row.route_id)
+            lats.append(lat[drawn])
+            lons.append(lon[drawn])
+            min_zooms.append(min_zoom[drawn])
+            offsets.append(offsets[-1] + int(drawn.sum()))
+
+        return cls(
+            route_ids,
+            offsets,
+            np.concatenate(lats) if lats else [],
+            np.concatenate(lons) if lons else [],
+            np.concatenate(min_zooms) if min_zooms else [],
+            zoom_levels,
+        )
+
+    def level_for_zoom(self, zoom: float) -> int:
+        # The most detailed precomputed level that doesn't exceed the map zoom
+        levels = [level for level in self.zoom_levels if level <= zoom]
+        return levels[-1] if levels else self.zoom_levels[0]
+
+    def lines(self, zoom: float) -> list[tuple[str, list[list[float]]]]:
+        level = self.level_for_zoom(zoom)
+        if level in self._lines_by_level:
+            return self._lines_by_level[level]
+
+        lines = []
+        for i, route_id in enumerate(self.route_ids):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            drawn = self.min_zoom[start:end] <= level
+            # Five decimals is about a metre, plenty for a route line
+            locations = np.column_stack(
+                [self.lat[start:end][drawn], self.lon[start:end][drawn]]
+            )
+            lines.append((str(route_id), np.round(locations.astype(float), 5).tolist()))
+
+        self._lines_by_level[level] = lines
+        return lines
+
+    def save(self, path: str | Path, feed_hash: str):
+        with replace_atomically(path) as scratch_path, open(scratch_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                feed_hash=np.array(feed_hash),
+                route_ids=self.route_ids,
+                offsets=self.offsets,
+                lat=self.lat,
+                lon=self.lon,
+                min_zoom=self.min_zoom,
+                zoom_levels=np.array(self.zoom_levels),
+            )
+
+    @classmethod
+    def load(cls, path: str | Path, feed_hash: str):
+        # None when there is no cache for this version of the static feed
+        try:
+            with np.load(path) as cached:
+                if str(cached["feed_hash"]) != feed_hash:
+                    return None
+                return cls(
+                    cached["route_ids"],
+                    cached["offsets"],
+                    cached["lat"],
+                    cached["lon"],
+                    cached["min_zoom"],
+                    cached["zoom_levels"].tolist(),
+                )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+
+def route_shapes_hash(shapes_path: str, trips_path: str) -> str:
+    return static_feed_hash(
+        shapes_path,
+        trips_path,
+        settings=(SHAPE_ZOOM_LEVELS, SHAPE_TOLERANCE_PIXELS),
+    )
+
+
+def build_route_shapes(
+    shapes_path: str = SHAPES_PATH,
+    trips_path: str = TRIPS_PATH,
+    cache_path: str = SHAPES_CACHE_PATH,
+) -> RouteShapes:
+    """Simplifies the static feed's route shapes and caches the result.
+
+    Takes seconds for a new feed, so it runs in the snapshot refresher before
+    its first fetch, never while rendering. Simplification only reruns when
+    the static feed (or its settings) change.
+    """
+    feed_hash = route_shapes_hash(shapes_path, trips_path)
+    route_shapes = RouteShapes.load(cache_path, feed_hash)
+    if route_shapes is not None:
+        return route_shapes
+
+    shapes = pd.read_csv(shapes_path)
+    trips = pd.read_csv(trips_path)
+    shapes["shape_id"] = shapes["shape_id"].astype(str)
+    stringify_trips_and_stops(trips)
+    trips["shape_id"] = trips["shape_id"].astype(str)
+    shapes_schema.validate(shapes)
+
+    route_shapes = RouteShapes.from_frames(shapes, trips)
+    route_shapes.save(cache_path, feed_hash)
+    return route_shapes
+
+
+@lru_cache(maxsize=1)
+def _load_route_shapes(
+    shapes_path: str, trips_path: str, cache_path: str, signature
+) -> Optional[RouteShapes]:
+    return RouteShapes.load(cache_path, route_shapes_hash(shapes_path, trips_path))
+
+
+def load_route_shapes(
+    shapes_path: str = SHAPES_PATH,
+    trips_path: str = TRIPS_PATH,
+    cache_path: str = SHAPES_CACHE_PATH,
+) -> Optional[RouteShapes]:
+    """Route shapes from the cache build_route_shapes writes, never simplifying.
+
+    None until the cache has been built for the static feed on disk. Kept in
+    memory until the feed or the cache changes.
+    """
+    try:
+        signature = file_signature(shapes_path, trips_path, cache_path)
+    except FileNotFoundError:
+        return None
+    return _load_route_shapes(shapes_path, trips_path, cache_path, signature)
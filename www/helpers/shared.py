@@ -0,0 +1,264 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import pyarrow as pa
+
+from www.helpers.constants import (
+    CHECKPOINT_DIR,
+    DATA_REFRESH_INTERVAL_SECONDS,
+    FOLLOWER_POLL_INTERVAL_SECONDS,
+    SHARED_SNAPSHOT_DIR,
+    SNAPSHOT_ROLE,
+)
+from www.helpers.feed import fetch_and_process_data, prepare_static_feed
+from www.helpers.snapshot import Snapshot, SnapshotStore
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("auto", "leader", "follower")
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "leader.lock"
+# Followers may still be reading the previous snapshot while a new one lands
+SNAPSHOTS_TO_KEEP = 3
+
+
+def write_shared_snapshot(
+    directory: Path, data: dict[str, pa.Table], version: int, created_at: float
+):
+    # Write into a scratch directory and rename it, so readers never see a
+    # partially written snapshot
+    scratch_dir = directory / f"{version}.tmp"
+    scratch_dir.mkdir(parents=True, exist_ok=True)
+    for key, table in data.items():
+        with pa.OSFile(str(scratch_dir / f"{key}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(scratch_dir, directory / str(version))
+
+    manifest = {"version": version, "created_at": created_at, "keys": list(data)}
+    scratch_current = directory / f"{CURRENT_FILE}.tmp"
+    scratch_current.write_text(json.dumps(manifest))
+    os.replace(scratch_current, directory / CURRENT_FILE)
+
+
+def read_manifest(directory: Path) -> Optional[dict]:
+    try:
+        return json.loads((directory / CURRENT_FILE).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def read_shared_snapshot(directory: Path, manifest: dict) -> dict[str, pa.Table]:
+    snapshot_dir = directory / str(manifest["version"])
+    data = {}
+    for key in manifest["keys"]:
+        # Memory-mapped and kept as Arrow, so every worker reads the same buffers
+        # straight from the page cache instead of holding its own copy
+        source = pa.memory_map(str(snapshot_dir / f"{key}.arrow"))
+        data[key] = pa.ipc.open_file(source).read_all()
+    return data
+
+
+def prune_shared_snapshots(directory: Path, keep: int = SNAPSHOTS_TO_KEEP):
+    versions = sorted(
+        int(path.name)
+        for path in directory.iterdir()
+        if path.is_dir() and path.name.isdigit()
+    )
+    for version in versions[:-keep]:
+        shutil.rmtree(directory / str(version), ignore_errors=True)
+
+
+class LeaderLock:
+    """Exclusive flock held by the process that fetches the feed.
+
+    The kernel releases the lock when its holder exits, so a follower can take
+    over if the leader dies.
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = False) -> bool:
+        if self._file is not None:
+            return True
+
+        lock_file = open(self._path, "a+")
+        if fcntl is None:
+            # No cross-process coordination available, so every process leads
+            self._file = lock_file
+            return True
+
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class SharedSnapshotStore(SnapshotStore):
+    """Snapshot store shared by several worker processes through a directory.
+
+    The leader fetches and processes the feed and writes each snapshot as Arrow
+    IPC files. Followers watch the ``CURRENT`` manifest and memory-map the files
+    of each new version instead of fetching the feed themselves.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        role: str = SNAPSHOT_ROLE,
+        fetch: Callable[[], dict] = fetch_and_process_data,
+        interval_secs: float = DATA_REFRESH_INTERVAL_SECONDS,
+        poll_interval_secs: float = FOLLOWER_POLL_INTERVAL_SECONDS,
+    ):
+        if role not in ROLES:
+            raise ValueError(f"Snapshot role must be one of {ROLES}, got {role!r}")
+
+        super().__init__(fetch=fetch, interval_secs=interval_secs)
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._role = role
+        self._poll_interval_secs = poll_interval_secs
+        self._manifest_mtime: Optional[int] = None
+        self._last_lead_at = 0.0
+        self._leader_lock = LeaderLock(self._directory / LOCK_FILE)
+
+        if role == "leader":
+            self._leader_lock.acquire(blocking=True)
+        elif role == "auto":
+            self._leader_lock.acquire()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_lock.held
+
+    def refresh(self) -> Optional[Snapshot]:
+        if self._role == "auto" and not self.is_leader:
+            # Take over if the previous leader has gone away
+            if self._leader_lock.acquire():
+                logger.info("Took over as snapshot leader in %s", self._directory)
+
+        # Pick up whatever is already published, including a previous leader's
+        # snapshot, so a new leader does not refetch a fresh snapshot
+        latest = self.sync()
+
+        if self.is_leader and self._seconds_since_refresh() >= self.interval_secs:
+            return self._lead()
+        return latest
+
+    def sync(self) -> Optional[Snapshot]:
+        try:
+            manifest_mtime = os.stat(self._directory / CURRENT_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return self.latest()
+        if manifest_mtime == self._manifest_mtime:
+            return self.latest()
+
+        manifest = read_manifest(self._directory)
+        if manifest is not None and manifest["version"] > self.version:
+            try:
+                data = read_shared_snapshot(self._directory, manifest)
+            except FileNotFoundError:
+                # Pruned while we were reading, the next poll sees a newer one
+                return self.latest()
+            self.publish(
+                data, version=manifest["version"], created_at=manifest["created_at"]
+            )
+
+        self._manifest_mtime = manifest_mtime
+        return self.latest()
+
+    def restore(self) -> Optional[Snapshot]:
+        # Snapshots outlive the processes that wrote them, so a restarted worker
+        # starts from the last one while the leader fetches a fresh one
+        return self.sync()
+
+    def stop(self):
+        super().stop()
+        self._leader_lock.release()
+
+    def _lead(self) -> Snapshot:
+        self._last_lead_at = time.time()
+        data = self._fetch()
+        version = self.next_version()
+        created_at = time.time()
+
+        write_shared_snapshot(self._directory, data, version, created_at)
+        # Publish the mapped files too, so the leader's snapshot is the same as
+        # its followers' and the fetched tables can be freed
+        manifest = {"version": version, "keys": list(data)}
+        data = read_shared_snapshot(self._directory, manifest)
+        snapshot = self.publish(data, version=version, created_at=created_at)
+        prune_shared_snapshots(self._directory)
+        return snapshot
+
+    def _seconds_since_refresh(self) -> float:
+        # Counts failed fetches too, so an upstream outage is retried once per
+        # interval rather than on every poll
+        latest = self.latest()
+        last_refresh_at = max(
+            self._last_lead_at, latest.created_at if latest is not None else 0.0
+        )
+        return time.time() - last_refresh_at
+
+    def _seconds_until_refresh(self) -> float:
+        if not self.is_leader:
+            return self._poll_interval_secs
+        return max(
+            self._poll_interval_secs,
+            self.interval_secs - self._seconds_since_refresh(),
+        )
+
+
+def create_snapshot_store() -> SnapshotStore:
+    # Without a shared directory, a lone worker leads and its checkpoint directory
+    # keeps the last snapshot for the next start
+    return SharedSnapshotStore(SHARED_SNAPSHOT_DIR or CHECKPOINT_DIR)
+
+
+if __name__ == "__main__":
+    # Sidecar refresher: fetch and publish snapshots for follower workers, e.g.
+    #   python -m www.helpers.shared --directory /dev/shm/halifax-transit
+    parser = argparse.ArgumentParser(description="Publish shared feed snapshots")
+    parser.add_argument("--directory", default=SHARED_SNAPSHOT_DIR)
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error("--directory or HALIFAX_SHARED_SNAPSHOT_DIR is required")
+
+    logging.basicConfig(level=logging.INFO)
+    store = SharedSnapshotStore(args.directory, role="leader")
+    store.start(prepare=prepare_static_feed)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        store.stop()
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from www.helpers.constants import DATA_REFRESH_INTERVAL_SECONDS
+from www.helpers.feed import fetch_and_process_data
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    # Monotonically increasing, milliseconds since the epoch at publish time
+    version: int
+    created_at: float
+    data: dict
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.created_at
+
+
+class SnapshotStore:
+    """Holds the latest processed feed snapshot for the whole process.
+
+    A single background thread refreshes the snapshot, so the upstream feed is
+    fetched and processed once per interval regardless of how many sessions or
+    API clients are reading it.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], dict] = fetch_and_process_data,
+        interval_secs: float = DATA_REFRESH_INTERVAL_SECONDS,
+    ):
+        self._fetch = fetch
+        self._interval_secs = interval_secs
+        self._snapshot: Optional[Snapshot] = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._publish_lock = threading.Lock()
+        self._listeners: list[Callable[[Snapshot], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval_secs(self) -> float:
+        return self._interval_secs
+
+    @property
+    def is_leader(self) -> bool:
+        # A standalone store always fetches the feed itself
+        return True
+
+    @property
+    def version(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else 0
+
+    def latest(self) -> Optional[Snapshot]:
+        return self._snapshot
+
+    def current(self, timeout: Optional[float] = None) -> Snapshot:
+        # Block until the first snapshot has been published
+        if not self._ready.wait(timeout):
+            raise TimeoutError("No snapshot has been published yet")
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[Snapshot], None]):
+        self._listeners.append(listener)
+
+    def next_version(self) -> int:
+        return max(time.time_ns() // 1_000_000, self.version + 1)
+
+    def refresh(self) -> Optional[Snapshot]:
+        return self.publish(self._fetch())
+
+    def publish(
+        self,
+        data: dict,
+        version: Optional[int] = None,
+        created_at: Optional[float] = None,
+    ) -> Snapshot:
+        with self._publish_lock:
+            snapshot = Snapshot(
+                version=version if version is not None else self.next_version(),
+                created_at=created_at if created_at is not None else time.time(),
+                data=data,
+            )
+
+            # Listeners derive their state before readers can see the new version
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception:
+                    logger.exception(
+                        "Snapshot listener failed for %s", snapshot.version
+                    )
+
+            self._snapshot = snapshot
+            self._ready.set()
+
+        return snapshot
+
+    def restore(self) -> Optional[Snapshot]:
+        # A standalone store keeps nothing between runs
+        return self.latest()
+
+    def start(self, prepare: Optional[Callable[[], None]] = None):
+        """Refresh in a background thread.
+
+        Any saved snapshot is restored before this returns, so the first
+        sessions render it rather than waiting for their next poll. ``prepare``
+        runs in the background thread before the first refresh, e.g. to
+        download the static feed without holding up startup.
+        """
+        if self._thread is not None:
+            return
+        try:
+            self.restore()
+        except Exception:
+            logger.exception("Failed to restore a snapshot")
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(prepare,), name="snapshot-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, prepare: Optional[Callable[[], None]] = None):
+        if prepare is not None:
+            try:
+                prepare()
+            except Exception:
+                # Refresh from whatever static data is already on disk
+                logger.exception("Failed to prepare the first refresh")
+
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the last good snapshot and retry next interval
+                logger.exception("Failed to refresh snapshot")
+            self._stopped.wait(self._seconds_until_refresh())
+
+    def _seconds_until_refresh(self) -> float:
+        return self._interval_secs
@@ -1,6 +1,12 @@
+import hashlib
+import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 
 def get_stop_info(merged_df: pd.DataFrame, stop_name: str) -> pd.DataFrame:
@@ -23,6 +29,36 @@ def get_stop_info(merged_df: pd.DataFrame, stop_name: str) -> pd.DataFrame:
     return output_df
 
 
+def rows_for_stop(table: pa.Table, stop_name, columns: list[str]) -> pd.DataFrame:
+    # Converts only the selected stop's rows of a snapshot table to pandas
+    matches = pc.equal(table["stop_name"], pa.scalar(stop_name, pa.string()))
+    return (
+        table.select(columns)
+        .filter(matches, null_selection_behavior="drop")
+        .to_pandas()
+    )
+
+
+def get_stop_arrivals(table: pa.Table, stop_name) -> pd.DataFrame:
+    # ETAs are worked out at render time, since the snapshot may be a
+    # checkpoint saved hours before this worker started
+    stop_df = rows_for_stop(
+        table,
+        stop_name,
+        [
+            "stop_name",
+            "route_id",
+            "trip_headsign",
+            "arrival_time",
+            "arrival_difference_minutes",
+        ],
+    )
+    stop_df["arrival_time_minutes_from_now"] = convert_to_minutes_from_now(
+        stop_df["arrival_time"]
+    )
+    return get_stop_info(stop_df, stop_name)
+
+
 def process_stop_times_date(time_str) -> str:
     # Parse the time string based on how it's presented in stop_times (e.g. 5:49:00)
     time_parts = time_str.split(":")
@@ -73,6 +109,72 @@ def get_time_value_in_minutes(time_column: pd.Series) -> pd.Series:
     return time_column.dt.total_seconds() / 60
 
 
+def get_delay_color(delay_minutes) -> str:
+    # Same thresholds as generate_styles: green when early, shades of red when late
+    if delay_minutes is None or pd.isna(delay_minutes):
+        return "#808080"
+
+    # Match the rounded delays shown in the tables
+    delay_minutes = round(delay_minutes)
+    if delay_minutes < 0:
+        return "#00a000"
+    if delay_minutes == 0:
+        return "#ffffff"
+    if delay_minutes >= 10:
+        return "#ff0000"
+    if delay_minutes >= 5:
+        return "#ff6060"
+    return "#ffb0b0"
+
+
+def describe_data_age(created_at: float, now: float, refresh_interval: float) -> str:
+    # Flags data restored from a checkpoint, or a refresh that has fallen behind
+    updated_at = datetime.fromtimestamp(created_at).strftime("%H:%M")
+    age_minutes = max(now - created_at, 0) // 60
+    if now - created_at <= 2 * refresh_interval:
+        return f"Live, updated {updated_at}"
+    if age_minutes < 60:
+        age = f"{age_minutes:.0f} min"
+    else:
+        age = f"{age_minutes // 60:.0f} h {age_minutes % 60:.0f} min"
+    return f"Last known data from {updated_at} ({age} ago), refreshing"
+
+
+def static_feed_hash(*paths: str, settings=()) -> str:
+    # Identifies a version of the static feed files, and of anything derived
+    # from them with ``settings``
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    digest.update(repr(settings).encode())
+    return digest.hexdigest()
+
+
+def file_signature(*paths: str) -> tuple:
+    # Changes whenever a file is rewritten, without reading it
+    return tuple(
+        (stat.st_mtime_ns, stat.st_size) for stat in (os.stat(path) for path in paths)
+    )
+
+
+@contextmanager
+def replace_atomically(path: str | Path):
+    """Yields a scratch path to write to, then renames it over ``path``.
+
+    Readers never see a half-written file, even when several workers build
+    the same cache at once.
+    """
+    path = Path(path)
+    scratch_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        yield scratch_path
+        os.replace(scratch_path, path)
+    finally:
+        scratch_path.unlink(missing_ok=True)
+
+
 def generate_styles(df, column_name):
     styles = []
 